@@ -0,0 +1,216 @@
+#'python NODE_Benchmark.py --backends numpy jax --output results.json' at command line
+# Times neural_ode (one training epoch's gradient) and forward_model (full rollout) over a grid of problem sizes
+# 'numpy' - node.minibatch/node.inference as used by the autograd scripts, 'jax' - node.jax_node (the notebook algorithm),
+# 'jax-scan' - the lax.scan/vmap gradient of node.jax_node, 'numpy-backprop' - node.backprop (discrete gradient),
+# 'autograd-loop' - NODE.py's neural_ode with minibatch_mode = 'loop' (one window at a time, the autograd reference)
+# first_call_s includes tracing and compilation for JAX (in-memory caches are cleared before every JAX point, so no point
+# reuses an earlier point's compilation - with --compilation-cache it is loaded from disk), steady state is the median of
+# the repeats after it
+import os, sys, json, time, argparse, itertools, platform
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from node.datagen import linear_trajectories
+from node.minibatch import neural_ode_batched
+from node.backprop import neural_ode_backprop
+from node.inference import rollout
+from node.layout import ParameterLayout
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Problem setup - a damped rotation in state_len dimensions and Xavier initialized parameters
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+def make_problem(state_len,num_neurons,tsteps,dt,seed=10):
+    rng = np.random.RandomState(seed)
+    skew = rng.randn(state_len,state_len)
+    ds_mat = -0.1*np.eye(state_len) + (skew - skew.T)
+    init_state = rng.randn(1,state_len)
+    true_state_array = linear_trajectories(init_state,ds_mat,tsteps,dt)[0]
+
+    layout = ParameterLayout([state_len,num_neurons,state_len])
+    thetas = layout.xavier(rng)
+
+    return true_state_array, layout.views(thetas), thetas
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Backends - each returns {'neural_ode': callable, 'forward_model': callable} for one grid point
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+def numpy_backend(point,true_state_array,layers,thetas,batch_ids):
+    dt = point['dt']
+    return {'neural_ode': lambda: neural_ode_batched(layers,true_state_array,batch_ids,point['batch_tsteps'],dt),
+            'forward_model': lambda: rollout(layers,true_state_array[0:1,:],point['tsteps'],dt)}
+
+def numpy_backprop_backend(point,true_state_array,layers,thetas,batch_ids):
+    functions = numpy_backend(point,true_state_array,layers,thetas,batch_ids)
+    functions['neural_ode'] = lambda: neural_ode_backprop(layers,true_state_array,batch_ids,point['batch_tsteps'],point['dt'])
+    return functions
+
+def jax_backend(point,true_state_array,layers,thetas,batch_ids):
+    import jax
+    jax.config.update('jax_enable_x64',True) # same precision as the autograd scripts
+    from node import jax_node
+
+    true_state_array, thetas, batch_ids = jax.device_put(true_state_array), jax.device_put(thetas), jax.device_put(batch_ids)
+    dt = point['dt']
+    sizes = {'state_len': point['state_len'], 'num_neurons': point['num_neurons']}
+
+    def neural_ode():
+        return jax.block_until_ready(jax_node.neural_ode_jit(thetas,true_state_array,batch_ids,dt,batch_tsteps=point['batch_tsteps'],**sizes))
+
+    def forward_model():
+        return jax.block_until_ready(jax_node.forward_model_jit(thetas,true_state_array[0:1,:],dt,tsteps=point['tsteps'],**sizes))
+
+    return {'neural_ode': neural_ode, 'forward_model': forward_model}
+
+# lax.scan/vmap gradient (node.jax_node.neural_ode_scan) - forward_model is shared with 'jax'
+def jax_scan_backend(point,true_state_array,layers,thetas,batch_ids):
+    import jax
+    from node import jax_node
+    functions = jax_backend(point,true_state_array,layers,thetas,batch_ids)
+
+    true_state_array, thetas, batch_ids = jax.device_put(true_state_array), jax.device_put(thetas), jax.device_put(batch_ids)
+    neural_ode_jit = jax.jit(jax_node.neural_ode_scan,static_argnames=('batch_tsteps','state_len','num_neurons'))
+
+    def neural_ode():
+        return jax.block_until_ready(neural_ode_jit(thetas,true_state_array,batch_ids,point['dt'],batch_tsteps=point['batch_tsteps'],
+                                                    state_len=point['state_len'],num_neurons=point['num_neurons']))
+
+    functions['neural_ode'] = neural_ode
+    return functions
+
+# Serial_Training/NODE.py configured for the grid point - its two dimensional system is replaced by the point's
+# trajectory and network, forward_model is the script's rollout (model_rollout, without the rollout cache)
+def autograd_loop_backend(point,true_state_array,layers,thetas,batch_ids):
+    from Serial_Training import NODE
+    NODE.configure(['--minibatch-mode','loop','--tsteps',str(point['tsteps']),'--final-time',str(point['tsteps']*point['dt']),
+                    '--batch-tsteps',str(point['batch_tsteps']),'--num-batches',str(point['num_batches']),
+                    '--num-neurons',str(point['num_neurons']),'--monitor-mode','off'])
+    NODE.state_len = point['state_len']
+    NODE.true_state_array = true_state_array
+    NODE.true_rhs_array = np.zeros_like(true_state_array) # read at the window starts only, not part of the gradient
+    NODE.layout = ParameterLayout([point['state_len'],point['num_neurons'],point['state_len']])
+    NODE.num_wb = NODE.layout.num_wb
+
+    return {'neural_ode': lambda: NODE.neural_ode(thetas,batch_ids),
+            'forward_model': lambda: NODE.model_rollout(thetas,true_state_array[0:1,:],point['tsteps'])}
+
+backends = {'numpy': numpy_backend, 'numpy-backprop': numpy_backprop_backend, 'jax': jax_backend, 'jax-scan': jax_scan_backend,
+            'autograd-loop': autograd_loop_backend}
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Timing
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+def time_function(function,repeats):
+    start_time = time.perf_counter()
+    function()
+    first_call = time.perf_counter() - start_time
+
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+
+    return {'first_call_s': first_call, 'median_s': float(np.median(times)), 'min_s': float(np.min(times)), 'repeats': repeats}
+
+def run_grid(args):
+    results = []
+    for backend, state_len, num_neurons, batch_tsteps, num_batches in itertools.product(args.backends,args.state_len,args.num_neurons,
+                                                                                         args.batch_tsteps,args.num_batches):
+        point = {'backend': backend, 'state_len': state_len, 'num_neurons': num_neurons, 'batch_tsteps': batch_tsteps,
+                 'num_batches': num_batches, 'tsteps': args.tsteps, 'dt': args.dt}
+        true_state_array, layers, thetas = make_problem(state_len,num_neurons,args.tsteps,args.dt)
+        batch_ids = np.random.RandomState(0).choice(args.tsteps-batch_tsteps,num_batches)
+        if backend.startswith('jax'): # cold first call - forward_model does not depend on batch_tsteps/num_batches, jax-scan reuses it
+            import jax
+            jax.clear_caches()
+        functions = backends[backend](point,true_state_array,layers,thetas,batch_ids)
+
+        for name in args.functions:
+            record = dict(point,function=name)
+            record.update(time_function(functions[name],args.repeats))
+            results.append(record)
+            print(format_record(record),flush=True)
+
+    return results
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Results and baseline comparison
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+key_fields = ['backend','function','state_len','num_neurons','batch_tsteps','num_batches','tsteps']
+
+def record_key(record):
+    return tuple(record[field] for field in key_fields)
+
+def format_record(record):
+    return ('{backend:>14} {function:>14} state_len={state_len:<4} num_neurons={num_neurons:<4} batch_tsteps={batch_tsteps:<4} '
+            'num_batches={num_batches:<4} first={first_call_s:.4f}s median={median_s:.6f}s').format(**record)
+
+def environment():
+    info = {'python': platform.python_version(), 'machine': platform.machine(), 'processor': platform.processor(), 'numpy': np.__version__}
+    try:
+        import jax
+        info['jax'] = jax.__version__
+    except ImportError:
+        pass
+    return info
+
+# Steady state medians against a stored results file - returns the keys slower than 1+tolerance
+def compare(results,baseline,tolerance):
+    baseline = {record_key(record): record for record in baseline['results']}
+    regressions = []
+    for record in results:
+        reference = baseline.get(record_key(record))
+        if reference is None:
+            continue
+        ratio = record['median_s']/reference['median_s']
+        flag = 'SLOWER' if ratio > 1.0 + tolerance else ('faster' if ratio < 1.0 - tolerance else '')
+        print('{:>14} {:>14} {}  {:.3f}x baseline {}'.format(record['backend'],record['function'],
+              ' '.join(str(value) for value in record_key(record)[2:]),ratio,flag))
+        if ratio > 1.0 + tolerance:
+            regressions.append(record_key(record))
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Neural ODE epoch and rollout timings')
+    parser.add_argument('--backends',nargs='+',default=['numpy'],choices=sorted(backends))
+    parser.add_argument('--functions',nargs='+',default=['neural_ode','forward_model'],choices=['neural_ode','forward_model'])
+    parser.add_argument('--state-len',nargs='+',type=int,default=[2,8,32])
+    parser.add_argument('--num-neurons',nargs='+',type=int,default=[30,100])
+    parser.add_argument('--batch-tsteps',nargs='+',type=int,default=[10,50])
+    parser.add_argument('--num-batches',nargs='+',type=int,default=[10,100])
+    parser.add_argument('--tsteps',type=int,default=2000)
+    parser.add_argument('--dt',type=float,default=0.0125)
+    parser.add_argument('--repeats',type=int,default=5)
+    parser.add_argument('--output',default=None,help='write results (JSON) to this file')
+    parser.add_argument('--baseline',default=None,help='compare against a results file written by --output')
+    parser.add_argument('--tolerance',type=float,default=0.1,help='relative slowdown reported as a regression')
+    parser.add_argument('--compilation-cache',default=None,help='persistent JAX compilation cache directory (first_call_s of a repeat run)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compilation_cache is not None:
+        from node.jax_compile import enable_compilation_cache
+        enable_compilation_cache(args.compilation_cache)
+    results = run_grid(args)
+
+    if args.output is not None:
+        with open(args.output,'w') as f:
+            json.dump({'environment': environment(), 'results': results},f,indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(results,json.load(f),args.tolerance)
+        return 1 if len(regressions) > 0 else 0
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,111 +1,217 @@
 #'mpiexec -n 4 python NODE_MPI.py' at command line
-import autograd.numpy as np
-import matplotlib.pyplot as plt
-from autograd import grad, jacobian, elementwise_grad
-from scipy.optimize import minimize
-from mpi4py import MPI
-
-np.random.seed(10)
-
-# MPI Fluff
-comm = MPI.COMM_WORLD
-rank = comm.Get_rank()
-nprocs = comm.Get_size()
+# or 'python NODE_MPI.py --parallel-backend pool' - pool_procs local ranks forked from this process, no MPI needed
+# Options override the configuration below, e.g. '--sync-interval 5 --num-neurons 40', '--config run.json', '--help' lists them
+# Importing the script defines its functions without side effects - configure() starts the ranks and reads the data, main() trains
+import numpy as np
+
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from node.adjoint import mlp_vjp, adjoint_rhs_analytic
+from node.inference import rollout
+from node.layout import ParameterLayout
+from node.minibatch import neural_ode_batched, window_loss
+from node.backprop import neural_ode_backprop, select_gradient_engine
+from node.integrators import get_integrator
+from node.optimizers import get_schedule, get_optimizer, EarlyStopping, lbfgs
+from node.precision import get_dtype, WorkingCopy, rollout_drift
+from node.parareal import parareal
+from node.evaluation import RolloutCache, Evaluator, write_metrics
+from node.predictor import export_model
+from node.monitor import Monitor, plot_spec
+from node.comm import broadcast_parameters, GradientSync
+from node.shards import load_time_major, shard_range, sample_windows
+from node.streaming import TrajectorySource, WindowPrefetcher
+from node.profiling import PhaseTimer
+from node.restart import RestartWriter, resume_state, set_rng_state, restart_filename
+from node.pool import spawn_ranks
+from node.config import parse_config
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Configuration - defaults, every name below is an option (node/config.py)
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+_names = set(globals())
+seed = 10 # numpy RNG seed of every rank - Xavier initialization (rank 0) and window sampling
+parallel_backend = 'mpi' # 'mpi' (launched with mpiexec) or 'pool' (single node, shared memory collectives)
+pool_procs = 4 # number of ranks with parallel_backend = 'pool'
 sync_interval = 10
-
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# Uploading data - each process gets its copy
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-true_state_array = np.transpose(np.load('Burgers_Coefficients.npy'))
-gp_state_array = np.transpose(np.load('Burgers_GP_Coefficients.npy'))[:-1,:]
-
-# conc_array = np.zeros(np.shape(true_state_array))
-# true_state_array = np.concatenate((true_state_array,conc_array),axis=1)
-
-tsteps = np.shape(true_state_array)[0]
-state_len = np.shape(true_state_array)[1]
-
+sync_overlap = False # True overlaps the gradient Iallreduce with the next epoch's neural_ode (update corrected one epoch later)
+data_file = 'Burgers_Coefficients.npy' # (state_len,tsteps) trajectory, relative to the working directory
+gp_file = 'Burgers_GP_Coefficients.npy' # GP baseline of the same trajectory, plotted by the monitor
+final_time = 2.0 # dt = final_time/(snapshots in data_file)
+tsteps = None # leading snapshots of the trajectory used (None - all)
 batch_tsteps = 10
 num_batches = 10
-dt = 2.0/tsteps
-
-# Time array - fixed
-time_array = dt*np.arange(tsteps)
-
-# DS definition
-init_state = true_state_array[0,:]
-
-# Visualization fluff here - defined in rank 0 alone
-if rank == 0:
-    fig, ax = plt.subplots(nrows=3,ncols=1,figsize=(8,8))
-    mnum = 0
-    for i in range(3):
-        ax[i].set_ylim(-1.0,1.5)
-        tt = ax[i].plot(time_array[:],true_state_array[:,mnum],label='True')
-        tt = ax[i].plot(time_array[:-1],gp_state_array[:,mnum],label='GP',color='green')
-        mnum = mnum + 1
-
-    ax[0].set_title('Mode 1')
-    ax[1].set_title('Mode 2')
-    ax[2].set_title('Mode 3')
-
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# Defining a neural network for parameterizing f(z,t) - for simplicity - assuming single layer - defined in rank 0
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# Define neural network parameters - simple 1-layer fc,ff nn - Xavier initialization
+num_epochs = 1000
 num_neurons = 20
-# Reshaping indices
-w1_idx_end = num_neurons*(state_len) # not inclusive
-b1_idx_start = num_neurons*(state_len)
-b1_idx_end = num_neurons*(state_len) + num_neurons
-
-w2_idx_start = num_neurons*(state_len) + num_neurons
-w2_idx_end = num_neurons*(state_len) + num_neurons + num_neurons*state_len
-
-b2_idx_start = num_neurons*(state_len) + num_neurons + num_neurons*state_len
-
-if rank == 0:
-    weights_1 = np.random.randn(state_len,num_neurons)*np.sqrt(1.0/(state_len+num_neurons)) 
-    weights_2 = np.random.randn(num_neurons,state_len)*np.sqrt(1.0/(state_len+num_neurons))  
-    bias_1 = np.random.randn(1,num_neurons)*np.sqrt(1.0/(num_neurons))
-    bias_2 = np.random.randn(1,state_len)*np.sqrt(1.0/(state_len))
-    # Flatten (and reshape) parameters for the purpose of autograd
-    thetas = np.concatenate((weights_1.flatten(),bias_1.flatten(),weights_2.flatten(),bias_2.flatten()),axis=0)
-    num_wb = np.shape(thetas)[0]
-    thetas = np.reshape(thetas,newshape=(1,num_wb))
-
-    for i in range(1,nprocs):
-        comm.send(thetas,dest=i,tag=i+10)
-        comm.send(num_wb,dest=i,tag=i+11)
-
-else:
-    thetas = comm.recv(source=0,tag=rank+10)
-    num_wb = comm.recv(source=0,tag=rank+11)
-
-# Reshaping function for parameters
+hidden_layers = None # widths of the hidden layers, None - [num_neurons], e.g. [20,20] for a deeper closure
+validation_fraction = 0.0 # trailing fraction of the trajectory held out - training windows end before it
+stream_files = None # e.g. ['Burgers_Coefficients_time_major.npy'] (node.shards.time_major_filename) - time-major trajectories read window by window (batched mode)
+stream_prefetch = 2 # batches read ahead of the gradient computation when streaming
+adjoint_engine = 'analytic' # 'analytic' vector-Jacobian products or 'autograd' full Jacobians (for checking)
+minibatch_mode = 'batched' # 'batched' steps all windows together (analytic adjoint) or 'loop' one window at a time (imports autograd)
+integrator = 'euler' # 'euler', 'rk4' or adaptive 'dopri5' - used by the batched mode and forward_model ('loop' is Euler only)
+integrator_rtol = 1e-6 # dopri5 error control
+integrator_atol = 1e-8
+checkpoint_mode = 'full' # batched mode forward state storage - 'full', or 'stride'/'revolve' recomputation
+checkpoint_budget = None # number of states kept per window by 'stride'/'revolve'
+precision = 'double' # 'single' - float32 forward/adjoint sweeps and rollouts (batched mode)
+master_weights = True # with 'single' - the optimizer updates float64 thetas, the sweeps use a float32 copy
+precision_tolerance = 1e-3 # relative drift of the float32 rollout from float64 above which rollouts (and the exported model) use float64
+gradient_engine = 'auto' # batched mode - 'backprop' through the unrolled euler/rk4 window (exact gradient of the discrete loss),
+                         # 'adjoint' continuous adjoint (uses checkpoint_mode), 'auto' backprop when its tape fits in backprop_memory
+backprop_memory = 2**28 # bytes of stored stage states per epoch for 'auto'
+optimizer = 'rmsprop' # 'rmsprop', 'adam' or 'lbfgs' - full batch L-BFGS (scipy) over the fixed windows lbfgs_ids, no restart files
+lr = 0.01 # initial learning rate of rmsprop/adam
+lr_schedule = 'step' # 'step' (x0.9 every 100 epochs), 'cosine' (to zero at the last epoch) or 'constant'
+validation_metric = 'rollout' # held-out check - 'rollout' mean per-mode relative error of the rollout from t = 0 over the held-out
+                              # range (node/evaluation.py), 'windows' loss of held-out windows restarted from the truth
+validation_interval = 10 # epochs (L-BFGS iterations) between held-out losses of rank 0's parameters
+early_stopping_patience = 20 # held-out losses without improvement before training stops and keeps the best parameters (0 - never)
+early_stopping_min_delta = 0.0 # relative improvement of the held-out loss below which a check counts as a plateau
+lbfgs_stride = 1 # the L-BFGS windows start every lbfgs_stride snapshots of the training range, split between the ranks
+lbfgs_maxiter = 200
+rollout_mode = 'serial' # forward_model, evaluations and monitor - 'serial' steps, or 'parareal' time slices of fine steps corrected in parallel (node/parareal.py)
+parareal_slices = 32 # time slices of the rollout
+parareal_coarse = 'rk4' # coarse propagator - integrator taking one step per parareal_coarse_factor fine steps
+parareal_coarse_factor = 100
+parareal_tolerance = 1e-6 # relative change of the slice start states at which the iteration stops
+weights_file = 'Trained_Weights.npy' # best parameters during and after training, read by forward_model (None - not written)
+model_file = 'Trained_Model.node' # standalone inference artifact of the trained model for node.predictor (None - not written)
+evaluation_file = 'Trained_Evaluation.json' # per-mode rollout errors of the trained model and the GP baseline (None - not written)
+monitor_mode = 'inline' # 'inline' plots in the training loop, 'process' in a background window, 'thread' to PNG files, 'off' for headless runs
+monitor_interval = 0.0 # minimum seconds between plot updates
+restart = False # resume training from the restart files when they exist (same number of ranks)
+restart_file = 'Training_Restart.npz' # parameters, optimizer state, iteration and RNG state - one file per rank (node.restart.restart_filename)
+restart_interval = 50 # iterations between restart files (0 disables them)
+restart_async = True # restart and weights_file files are written on a background thread
+profile = False # per-epoch phase timings and evaluation counts, one JSON line per epoch in each rank's profile_file
+profile_file = 'Training_Profile_rank{rank}.jsonl' # {rank} - the rank's number
+defaults = {name: value for name, value in globals().items() if name not in _names and not name.startswith('_')}
+
+integrator_stats = {} # rhs evaluations and steps, accumulated over training
+window_stream = None # WindowPrefetcher over stream_files, started by optimize
+training_stats = {} # epochs, best minibatch loss (rank 0) and best held-out loss and epoch of the last optimize/lbfgs_optimize
+
+# MPI Fluff - ranks of the launch, or forked from this process by the pool backend
+def start_ranks():
+    global comm, rank, nprocs
+    if parallel_backend == 'pool':
+        comm = spawn_ranks(pool_procs)
+    else:
+        from mpi4py import MPI
+        comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+    nprocs = comm.Get_size()
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Uploading data - read-only time-major memory maps shared by all processes on a node
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+def load_data():
+    global true_state_array, gp_state_array, tsteps, state_len, dt
+    true_state_array = load_time_major(data_file,comm)
+    gp_state_array = load_time_major(gp_file,comm)[:-1,:]
+
+    # conc_array = np.zeros(np.shape(true_state_array))
+    # true_state_array = np.concatenate((true_state_array,conc_array),axis=1)
+
+    dt = final_time/np.shape(true_state_array)[0]
+    if tsteps is not None: # views of the leading rows of the maps
+        true_state_array, gp_state_array = true_state_array[:tsteps,:], gp_state_array[:tsteps-1,:]
+    tsteps = np.shape(true_state_array)[0]
+    state_len = np.shape(true_state_array)[1]
+
+# Settings derived from the configuration and the data
+def setup():
+    global ode_step, work_dtype, working_thetas, rank_restart_file, timer, validation_steps, num_train_starts, validation_ids
+    global window_shard, lbfgs_ids, time_array, init_state
+    ode_step = get_integrator(integrator,integrator_rtol,integrator_atol)
+    work_dtype = get_dtype(precision)
+    working_thetas = WorkingCopy(work_dtype)
+    rank_restart_file = restart_filename(restart_file,rank)
+    timer = PhaseTimer(profile_file.format(rank=rank),enabled=profile,rank=rank)
+
+    validation_steps = int(validation_fraction*tsteps)
+    num_train_starts = tsteps - batch_tsteps - validation_steps # window starts sampled for training
+    validation_ids = np.arange(tsteps-validation_steps,tsteps-batch_tsteps+1,batch_tsteps) # non-overlapping held-out windows
+    window_shard = shard_range(num_train_starts,rank,nprocs) # window start indices sampled by this rank only
+    lbfgs_ids = np.arange(0,num_train_starts,lbfgs_stride)
+    lbfgs_ids = lbfgs_ids[slice(*shard_range(len(lbfgs_ids),rank,nprocs))]
+
+    if stream_files is not None and minibatch_mode != 'batched':
+        raise ValueError("stream_files needs minibatch_mode = 'batched'")
+    if stream_files is not None and (validation_steps > 0 or optimizer == 'lbfgs'):
+        raise ValueError("validation_fraction and optimizer = 'lbfgs' use the in-memory trajectory (stream_files = None)")
+    if num_train_starts <= 0 or (validation_steps > 0 and len(validation_ids) == 0):
+        raise ValueError('validation_fraction leaves no training or no held-out windows of batch_tsteps snapshots')
+    if work_dtype != np.float64 and minibatch_mode != 'batched':
+        raise ValueError("precision = '"+precision+"' needs minibatch_mode = 'batched'")
+    if gradient_engine == 'backprop' and minibatch_mode != 'batched':
+        raise ValueError("gradient_engine = 'backprop' needs minibatch_mode = 'batched'")
+
+    # Time array - fixed
+    time_array = dt*np.arange(tsteps)
+
+    # DS definition
+    init_state = true_state_array[0,:]
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Defining a neural network for parameterizing f(z,t) - tanh MLP, single hidden layer by default - defined in rank 0
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Define neural network parameters - fc,ff tanh nn - Xavier initialization
+def init_network():
+    global layout, num_wb, gradient_mode, thetas
+    layout = ParameterLayout([state_len]+(hidden_layers or [num_neurons])+[state_len]) # all weights and biases in one flat (1,num_wb) buffer
+    num_wb = layout.num_wb
+    gradient_mode = 'adjoint'
+    if minibatch_mode == 'batched':
+        gradient_mode = select_gradient_engine(gradient_engine,ode_step,batch_tsteps,len(lbfgs_ids) if optimizer == 'lbfgs' else num_batches,
+                                               state_len,work_dtype,checkpoint_mode,backprop_memory)
+    if rank == 0:
+        print('Gradient engine: ',gradient_mode)
+        thetas = layout.xavier()
+    else:
+        thetas = layout.zeros()
+
+    thetas = broadcast_parameters(comm,thetas,root=0)
+    if not master_weights:
+        thetas = thetas.astype(work_dtype) # optimizer in the reduced precision as well
+
+# Rollouts of the trained range and the held-out range against the truth and the GP baseline, sharing the trajectories of
+# the same thetas (node/evaluation.py) - used by rank 0
+def init_evaluation():
+    global rollout_cache, fit_evaluator, evaluator
+    rollout_cache = RolloutCache(layout,true_state_array[0:1,:],dt,ode_step,max_entries=early_stopping_patience+2, # keeps the best thetas
+                                 rollout_function=model_rollout)
+    fit_evaluator = Evaluator(rollout_cache,true_state_array,[(0,tsteps-validation_steps)],gp_state_array)
+    evaluator = None
+    if validation_steps > 0:
+        evaluator = Evaluator(rollout_cache,true_state_array,[(tsteps-validation_steps,tsteps)],gp_state_array)
+
+# Visualization fluff here - defined in rank 0 alone, matplotlib is imported by the monitor unless monitor_mode = 'off'
+# Plots rank_forward_model - started (forked with monitor_mode = 'process') once the network and the rollout cache exist
+def init_monitor():
+    global monitor
+    monitor = Monitor(monitor_mode if rank == 0 else 'off',
+                      plot_spec(true_state_array[0:1,:],tsteps,dt,integrator,num_modes=3,time_array=time_array,
+                                references=[('True',time_array,true_state_array,None),('GP',time_array[:-1],gp_state_array,'green')],
+                                ylim=(-1.0,1.5),figsize=(8,8)),monitor_interval,predict=rank_forward_model)
+
+# Reshaping function for parameters - per-layer (W,b) views of the flat buffer, no copies
 def theta_reshape(thetas):
-    weights_1_flattened = thetas[0,0:w1_idx_end]
-    bias_1_flattened = thetas[0,b1_idx_start:b1_idx_end]
-
-    weights_2_flattened = thetas[0,w2_idx_start:w2_idx_end]
-    bias_2_flattened = thetas[0,b2_idx_start:]
-
-    weights_1 = np.reshape(weights_1_flattened,(state_len,num_neurons))
-    weights_2 = np.reshape(weights_2_flattened,(num_neurons,state_len))
-
-    bias_1 = np.reshape(bias_1_flattened,(1,num_neurons))
-    bias_2 = np.reshape(bias_2_flattened,(1,state_len))
-
-    return weights_1, weights_2, bias_1, bias_2
+    return layout.views(thetas)
 
 # Simple Feed forward network for RHS calculation
-def ffnn(state,weights_1,weights_2,bias_1,bias_2):
-    h = np.tanh(np.matmul(state,weights_1)+bias_1)
-    return np.matmul(h,weights_2)+bias_2
+def ffnn(state,layers):
+    h = state
+    for weights, bias in layers[:-1]:
+        h = np.tanh(np.matmul(h,weights)+bias)
+    return np.matmul(h,layers[-1][0])+layers[-1][1]
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -113,11 +219,11 @@ def ffnn(state,weights_1,weights_2,bias_1,bias_2):
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Forward model (Neural ODE formulation) - one timestep
-def euler_forward(state,weights_1,weights_2,bias_1,bias_2,time):
+def euler_forward(state,layers,time):
     # Step 1
-    i0 = state + dt*ffnn(state,weights_1,weights_2,bias_1,bias_2)
+    i0 = state + dt*ffnn(state,layers)
     # Output for saving state
-    f_rhs = ffnn(i0,weights_1,weights_2,bias_1,bias_2)
+    f_rhs = ffnn(i0,layers)
 
     return i0, f_rhs
 
@@ -131,30 +237,22 @@ def euler_forward(state,weights_1,weights_2,bias_1,bias_2,time):
 def training_loss_state(state,true_state):
     loss = np.sum((state - true_state)**2)
     return loss
-# Its gradient
-dldz_func = elementwise_grad(training_loss_state,0) # Output is a (1,state_len) array
 # Secondly as a function of pvec (a concatenated vector of state,thetas,time)
 def training_loss(pvec,true_state):
     _state = np.reshape(pvec[:,:state_len],(1,state_len)) # The state
     _thetas = np.reshape(pvec[:,state_len:-1],(1,num_wb)) # NN Parameters
     _time = np.reshape(pvec[:,-1],(1,1)) # Time
-    _weights_1, _weights_2, _bias_1, _bias_2 = theta_reshape(_thetas)
-    _output_state, _ = euler_forward(_state,_weights_1,_weights_2, _bias_1, _bias_2,_time)
+    _output_state, _ = euler_forward(_state,theta_reshape(_thetas),_time)
     loss = np.sum((_output_state - true_state)**2)
     return loss
-# Its gradient
-dl_func = elementwise_grad(training_loss,0) # Output is a (1,state_len+num_wb+1) array
 # Now we define the parameterization (i.e., the rhs of the ODE in terms of an NN - f(z))
 def rhs_calculator(pvec):
     _state = np.reshape(pvec[:,:state_len],(1,state_len)) # The state
     _thetas = np.reshape(pvec[:,state_len:-1],(1,num_wb)) # NN Parameters
     _time = np.reshape(pvec[:,-1],(1,1)) # Time    
-    _weights_1, _weights_2, _bias_1, _bias_2 = theta_reshape(_thetas)
-    rhs = ffnn(_state,_weights_1,_weights_2, _bias_1, _bias_2)
+    rhs = ffnn(_state,theta_reshape(_thetas))
     rhs = rhs.flatten()
     return rhs
-# Calculate Jacobians - dfdz, dfdthetas, dfdt
-df_func = jacobian(rhs_calculator) # Output is a (state_len,1,state_len+num_wb+1) array - must be squeezed as needed
 # Adjoint RHS calculation
 def adjoint_rhs(a,pvec):
     # Time to calculate Jacobians
@@ -169,23 +267,50 @@ def adjoint_rhs(a,pvec):
 
     return rhs_reverse
 
+# Gradients and Jacobians of the functions above ('loop' mode) - numpy is replaced by autograd's traceable wrapper
+def use_autograd():
+    global np, dldz_func, dl_func, df_func
+    import autograd.numpy as np
+    from autograd import elementwise_grad, jacobian
+    dldz_func = elementwise_grad(training_loss_state,0) # Output is a (1,state_len) array
+    dl_func = elementwise_grad(training_loss,0) # Output is a (1,state_len+num_wb+1) array
+    # Calculate Jacobians - dfdz, dfdthetas, dfdt
+    df_func = jacobian(rhs_calculator) # Output is a (state_len,1,state_len+num_wb+1) array - must be squeezed as needed
+
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Neural ODE algorithm - minibatching
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def neural_ode(thetas):
-    weights_1, weights_2, bias_1, bias_2 = theta_reshape(thetas) # Reshape once for utilization in entire iteration
-    batch_state_array = np.zeros(shape=(num_batches,batch_tsteps,state_len),dtype='double') # 
-    batch_rhs_array = np.zeros(shape=(num_batches,batch_tsteps,state_len),dtype='double') #
-    batch_time_array = np.zeros(shape=(num_batches,batch_tsteps,1),dtype='double') #
+# batch_ids - window starts, num_batches random windows of this rank's shard when not given
+def neural_ode(thetas,batch_ids=None):
+    layers = theta_reshape(working_thetas(thetas)) # Reshape once for utilization in entire iteration
+    if window_stream is not None: # Prefetched windows stacked along time, batch_ids their first rows
+        with timer.phase('data'):
+            window_data, batch_ids = window_stream.next()
+        if gradient_mode == 'backprop':
+            return neural_ode_backprop(layers,window_data,batch_ids,batch_tsteps,dt,ode_step,integrator_stats,timer)
+        return neural_ode_batched(layers,window_data,batch_ids,batch_tsteps,dt,ode_step,integrator_stats,
+                                  checkpoint_mode,checkpoint_budget,timer)
+
+    if batch_ids is None:
+        batch_ids = sample_windows(window_shard,num_batches)
+
+    if minibatch_mode == 'batched':
+        if gradient_mode == 'backprop':
+            return neural_ode_backprop(layers,true_state_array,batch_ids,batch_tsteps,dt,ode_step,integrator_stats,timer)
+        return neural_ode_batched(layers,true_state_array,batch_ids,batch_tsteps,dt,ode_step,integrator_stats,
+                                  checkpoint_mode,checkpoint_budget,timer)
+
+    batch_state_array = np.zeros(shape=(len(batch_ids),batch_tsteps,state_len),dtype='double') # 
+    batch_rhs_array = np.zeros(shape=(len(batch_ids),batch_tsteps,state_len),dtype='double') #
+    batch_time_array = np.zeros(shape=(len(batch_ids),batch_tsteps,1),dtype='double') #
 
     augmented_state = np.zeros(shape=(1,state_len+num_wb+1))
-    batch_ids = np.random.choice(tsteps-batch_tsteps,num_batches)
 
     # Minibatching within sampled domain
     total_batch_loss = 0.0
-    for j in range(num_batches):
+    for j in range(len(batch_ids)):
         start_id = batch_ids[j]
         end_id = start_id + batch_tsteps
 
@@ -193,13 +318,15 @@ def neural_ode(thetas):
         batch_time_array[j,:batch_tsteps] = time_array[start_id:end_id,None]
 
         # Calculate forward pass - saving results for state and rhs to array - batchwise
-        temp_state = np.copy(batch_state_array[j,0,:])
-        for i in range(1,batch_tsteps):
-            time = np.reshape(batch_time_array[j,i],newshape=(1,1))
-            output_state, output_rhs = euler_forward(temp_state,weights_1,weights_2,bias_1,bias_2,time)  
-            batch_state_array[j,i,:] = output_state[:]
-            batch_rhs_array[j,i,:] = output_rhs[:]
-            temp_state = np.copy(output_state)
+        with timer.phase('forward'):
+            temp_state = np.copy(batch_state_array[j,0,:])
+            for i in range(1,batch_tsteps):
+                time = np.reshape(batch_time_array[j,i],newshape=(1,1))
+                output_state, output_rhs = euler_forward(temp_state,layers,time)  
+                batch_state_array[j,i,:] = output_state[:]
+                batch_rhs_array[j,i,:] = output_rhs[:]
+                temp_state = np.copy(output_state)
+        timer.count('forward_rhs',2*(batch_tsteps-1)) # euler_forward also returns the rhs at the new state
 
         # Operations at final time step (setting up initial conditions for the adjoint)
         temp_state = np.copy(batch_state_array[j,-2,:])
@@ -207,153 +334,333 @@ def neural_ode(thetas):
         time = np.reshape(batch_time_array[j,-2],(1,1)) # prefinal time
         pvec = np.concatenate((temp_state,thetas,time),axis=1)
 
-        # Calculate loss related gradients - dldz
-        dldz = np.reshape(dldz_func(output_state,true_state_array[end_id-1,:]),(1,state_len))
-        # With respect to weights,bias and time
-        dl = dl_func(pvec,true_state_array[end_id-1,:])
-        dldthetas = np.reshape(dl[:,state_len:-1],newshape=(1,num_wb))
-        # Calculate dl/dt
-        dldt = np.matmul(dldz,batch_rhs_array[j,-1,:])
-        dldt = np.reshape(dldt,newshape=(1,1))
+        with timer.phase('loss_gradient'):
+            # Calculate loss related gradients - dldz
+            dldz = np.reshape(dldz_func(output_state,true_state_array[end_id-1,:]),(1,state_len))
+            # With respect to weights,bias and time
+            if adjoint_engine == 'analytic':
+                _, dldthetas = mlp_vjp(dldz,temp_state,layers)
+                dldthetas = dt*dldthetas
+            else:
+                dl = dl_func(pvec,true_state_array[end_id-1,:])
+                dldthetas = np.reshape(dl[:,state_len:-1],newshape=(1,num_wb))
+            # Calculate dl/dt
+            dldt = np.matmul(dldz,batch_rhs_array[j,-1,:])
+            dldt = np.reshape(dldt,newshape=(1,1))
+        timer.count('loss_gradient',2)
 
         # Find batch loss
         total_batch_loss = total_batch_loss + np.sum((output_state-true_state_array[end_id-1,:])**2)
 
         # Reverse operation (adjoint evolution in backward time)
-        _augmented_state = np.concatenate((dldz,dldthetas,dldt),axis=1)
-        for i in range(1,batch_tsteps):
-            time = np.reshape(batch_time_array[j,-1-i],newshape=(1,1))
-            state_now = np.reshape(batch_state_array[j,-1-i,:],newshape=(1,state_len))
-            pvec = np.concatenate((state_now,thetas,time),axis=1)
-
-            # Adjoint propagation backward in time
-            i0 = _augmented_state + dt*adjoint_rhs(_augmented_state,pvec)
-            sub_state = np.reshape(i0[0,:state_len],newshape=(1,state_len))
-
-            _augmented_state[:,:] = i0[:,:]
+        with timer.phase('adjoint'):
+            _augmented_state = np.concatenate((dldz,dldthetas,dldt),axis=1)
+            for i in range(1,batch_tsteps):
+                time = np.reshape(batch_time_array[j,-1-i],newshape=(1,1))
+                state_now = np.reshape(batch_state_array[j,-1-i,:],newshape=(1,state_len))
+
+                # Adjoint propagation backward in time
+                if adjoint_engine == 'analytic':
+                    i0 = _augmented_state + dt*adjoint_rhs_analytic(_augmented_state,state_now,layers)
+                else:
+                    pvec = np.concatenate((state_now,thetas,time),axis=1)
+                    i0 = _augmented_state + dt*adjoint_rhs(_augmented_state,pvec)
+                sub_state = np.reshape(i0[0,:state_len],newshape=(1,state_len))
+
+                _augmented_state[:,:] = i0[:,:]
+        timer.count('adjoint_vjp' if adjoint_engine == 'analytic' else 'jacobian',batch_tsteps-1)
         
         augmented_state = np.add(augmented_state,_augmented_state)
     
     return augmented_state, total_batch_loss
 
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# Visualization function
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def visualize(mode='train'):
-    predicted_states = forward_model()
-    # Visualization of modal evolution
-    ln1, = ax[0].plot(time_array[:],predicted_states[:,0],label='ML',color='orange')
-    ln2, = ax[1].plot(time_array[:],predicted_states[:,1],label='ML',color='orange')
-    ln3, = ax[2].plot(time_array[:],predicted_states[:,2],label='ML',color='orange')
-
-    plt.legend()
-    plt.tight_layout()
-    plt.pause(0.01)
-    plt.draw()
+# Held-out loss of rank 0's parameters (ranks differ between syncs) - the early stopping decision is broadcast so that
+# all ranks leave the training loop at the same iteration
+def validation_stop(epoch,thetas,early_stopping):
+    stop = np.zeros(1)
+    if rank == 0:
+        with timer.phase('validation'):
+            if validation_metric == 'rollout':
+                metrics = evaluator.evaluate(thetas)
+                held_out_loss = metrics['error']
+            else:
+                held_out_loss = window_loss(theta_reshape(working_thetas(thetas)),true_state_array,validation_ids,batch_tsteps,dt,ode_step)
+        stop[0] = early_stopping.update(epoch,held_out_loss,thetas)
+        if validation_metric == 'rollout':
+            print('iteration: ',epoch,' Held-out loss: ',held_out_loss,' GP: ',metrics['baseline_error'])
+        else:
+            print('iteration: ',epoch,' Held-out loss: ',held_out_loss)
+        if early_stopping.best_epoch == epoch and weights_file is not None: # checkpoints by held-out loss
+            with timer.phase('save'):
+                np.save(weights_file,thetas)
+    comm.Bcast(stop,root=0)
+    return stop[0] > 0
 
-    if mode=='train':
-       ln1.remove()
-       ln2.remove()
-       ln3.remove()
-    
-        
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Optimization
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def rms_prop_optimize(thetas):
-    num_epochs = 1000
-    lr = 0.01
-    beta = 0.9
-    lr_counter = 0
-    exp_gradient = np.zeros(shape=(1,num_wb))
+def optimize(thetas):
+    global window_stream
+    opt = get_optimizer(optimizer,get_schedule(lr_schedule,lr,num_epochs))
+    early_stopping = EarlyStopping(early_stopping_patience,early_stopping_min_delta)
     best_loss = np.Inf
     total_batch_loss = best_loss
-    
     sync_ranks = 0
-    for epoch in range(num_epochs):
+    start_epoch = 0
+
+    if restart:
+        state = resume_state(rank_restart_file,comm)
+        if state is not None:
+            thetas, best_loss = state['thetas'], float(state['best_loss'])
+            opt.load_state(state)
+            early_stopping.load_state(state)
+            total_batch_loss, sync_ranks = float(state['total_batch_loss']), int(state['sync_ranks'])
+            start_epoch = int(state['epoch']) + 1
+            set_rng_state(state)
+            if rank == 0:
+                print('Resuming from iteration: ',start_epoch)
+
+    if stream_files is not None: # One batch per epoch - a resumed run skips the batches already used
+        source = TrajectorySource(stream_files,batch_tsteps)
+        window_stream = WindowPrefetcher(source,num_batches,shard_range(source.num_windows,rank,nprocs),stream_prefetch,
+                                         start_batch=start_epoch)
+
+    restart_writer = RestartWriter(restart_interval,restart_async,last_epoch=start_epoch-1)
+    gradient_sync = GradientSync(comm,num_wb,overlap=sync_overlap)
+    training_stats.update(epochs=start_epoch,held_out_loss=None,best_epoch=None)
+    for epoch in range(start_epoch,num_epochs):
+        training_stats['epochs'] = epoch + 1
         sync_ranks = sync_ranks + 1
         augmented_state_local, total_batch_loss_local = neural_ode(thetas)
 
-        if epoch == 0:
-            exp_gradient = (1.0-beta)*(augmented_state_local[0,state_len:-1]**2)
-        else:
-            exp_gradient = beta*exp_gradient + (1.0-beta)*(augmented_state_local[0,state_len:-1]**2)
+        if gradient_sync.pending(): # Overlapped exchange from the last sync - swap the provisional local update for the average
+            with timer.phase('wait'):
+                local_update, del_theta_g, total_batch_loss = gradient_sync.finish()
+            thetas = thetas + local_update - del_theta_g
 
-        del_theta = lr/(np.sqrt(exp_gradient))*(augmented_state_local[0,state_len:-1])
+        with timer.phase('optimizer'):
+            del_theta = opt.update(augmented_state_local[0,state_len:-1])
 
         if sync_ranks == sync_interval:
-            # Average gradients and exchange
-            if rank == 0:
-                del_theta_g = np.zeros_like(del_theta)
-                total_batch_loss = np.zeros_like(total_batch_loss_local)
-            else:
-                del_theta_g = None
-                total_batch_loss = None
-
-            comm.Reduce([del_theta, MPI.DOUBLE],[del_theta_g, MPI.DOUBLE],op = MPI.SUM,root = 0) # Root is process zero
-            comm.Reduce([total_batch_loss_local, MPI.DOUBLE],[total_batch_loss, MPI.DOUBLE],op = MPI.SUM,root = 0) # Root is process zero
-
-            if rank == 0: # Optimization is done by rank==0 only
-                del_theta = del_theta_g/nprocs # Calculate average gradient 
-                for i in range(1,nprocs):
-                    comm.send(del_theta,dest=i,tag=i+12)
-            else:
-                del_theta = comm.recv(source=0,tag=rank+12)
+            # Average gradients and exchange - every rank receives the average (Allreduce)
+            if profile and not sync_overlap:
+                with timer.phase('wait'): # Rank imbalance - time until the slowest rank arrives
+                    comm.Barrier()
+            with timer.phase('communication'):
+                gradient_sync.start(del_theta,total_batch_loss_local)
+                if not sync_overlap:
+                    _, del_theta, total_batch_loss = gradient_sync.finish()
 
             sync_ranks = 0 # Reset
 
-        thetas = thetas - del_theta
-        lr_counter = lr_counter + 1 
-
-        if lr_counter > 100:
-            lr = lr*0.9
-            lr_counter = 0 
+        with timer.phase('optimizer'):
+            thetas = thetas - del_theta
 
         if rank == 0:
             if total_batch_loss<best_loss:
-                np.save('Trained_Weights.npy',thetas)
+                if len(validation_ids) == 0 and weights_file is not None: # otherwise the best held-out ones (validation_stop)
+                    with timer.phase('save'):
+                        restart_writer.save_weights(weights_file,thetas)
                 best_loss = total_batch_loss
-                visualize()
+                with timer.phase('plot'):
+                    monitor.update(thetas)
                 print('iteration: ',epoch,' Loss: ',total_batch_loss)                    
 
+        stop = len(validation_ids) > 0 and epoch % validation_interval == 0 and validation_stop(epoch,thetas,early_stopping)
+
+        # Not while an overlapped exchange is in flight - every rank defers to the same later iteration
+        if restart_writer.due(epoch) and not gradient_sync.pending():
+            with timer.phase('save'):
+                restart_writer.save(rank_restart_file,epoch,thetas=thetas,best_loss=best_loss,total_batch_loss=total_batch_loss,
+                                    sync_ranks=sync_ranks,nprocs=nprocs,**opt.state(),**early_stopping.state())
+
+        timer.end_epoch(epoch,loss=total_batch_loss_local,synced=(sync_ranks == 0))
+        if stop:
+            if rank == 0:
+                print('Early stopping at iteration: ',epoch,' - best held-out loss ',early_stopping.best_loss,' at iteration: ',
+                      early_stopping.best_epoch)
+            break
+
+    if gradient_sync.pending():
+        local_update, del_theta_g, _ = gradient_sync.finish()
+        thetas = thetas + local_update - del_theta_g
+
+    restart_writer.close()
+    if window_stream is not None:
+        window_stream.close()
+        window_stream = None
+    training_stats['best_loss'] = float(best_loss)
+    if early_stopping.best_thetas is not None:
+        thetas = early_stopping.best_thetas
+        training_stats.update(held_out_loss=float(early_stopping.best_loss),best_epoch=early_stopping.best_epoch)
+    return thetas
+
+# Full batch L-BFGS - every rank evaluates its share of lbfgs_ids, the loss and gradient are averaged over the ranks
+# (one GradientSync exchange per evaluation), so all ranks run the same iterations in lockstep
+def lbfgs_optimize(thetas):
+    early_stopping = EarlyStopping(early_stopping_patience,early_stopping_min_delta)
+    gradient_sync = GradientSync(comm,num_wb)
+    last = {'loss': np.Inf}
+
+    def loss_and_gradient(thetas):
+        augmented_state_local, total_batch_loss_local = neural_ode(thetas,lbfgs_ids)
+        with timer.phase('communication'):
+            gradient_sync.start(augmented_state_local[0,state_len:-1],total_batch_loss_local)
+            _, gradient, total_batch_loss = gradient_sync.finish()
+        last['loss'] = total_batch_loss/nprocs
+        return last['loss'], gradient
+
+    # After every iteration - the last evaluation was at the accepted parameters
+    def callback(iteration,thetas):
+        training_stats.update(epochs=iteration+1,best_loss=min(training_stats['best_loss'],last['loss']))
+        if rank == 0:
+            if len(validation_ids) == 0 and weights_file is not None:
+                with timer.phase('save'):
+                    np.save(weights_file,thetas)
+            with timer.phase('plot'):
+                monitor.update(thetas)
+            print('iteration: ',iteration,' Loss: ',last['loss'])
+        stop = len(validation_ids) > 0 and iteration % validation_interval == 0 and validation_stop(iteration,thetas,early_stopping)
+        timer.end_epoch(iteration,loss=last['loss'])
+        return stop
+
+    training_stats.update(epochs=0,best_loss=np.Inf,held_out_loss=None,best_epoch=None)
+    thetas, result = lbfgs(loss_and_gradient,thetas,lbfgs_maxiter,callback)
+    if rank == 0:
+        if result is None:
+            print('Early stopping - best held-out loss ',early_stopping.best_loss,' at iteration: ',early_stopping.best_epoch)
+        else:
+            print('L-BFGS: ',result.message)
+    if early_stopping.best_thetas is not None:
+        thetas = early_stopping.best_thetas
+        training_stats.update(held_out_loss=float(early_stopping.best_loss),best_epoch=early_stopping.best_epoch)
     return thetas
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Forward model
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def forward_model():
-    thetas = np.load('Trained_Weights.npy')
-    weights_1, weights_2, bias_1, bias_2 = theta_reshape(thetas)
+# Every rollout of the script - forward_model, the rollout evaluations (through rollout_cache) and the monitor
+# init_states (num_traj,state_len), returns (num_traj,num_steps,state_len) trajectories
+# comm - parareal slices on all ranks (collective), otherwise this rank runs them in turn (the evaluations on rank 0)
+def model_rollout(thetas,init_states,num_steps,stats=None,comm=None):
+    if work_dtype != np.float64: # Reduced precision rollout, guarded by the float64 one
+        pred_state_array, reference_state_array, drift = rollout_drift(layout,thetas,init_states,num_steps,dt,ode_step,work_dtype,
+                                                                       precision_tolerance,stats,
+                                                                       lambda *args, **kwargs: mode_rollout(*args,comm=comm,**kwargs))
+        if drift['drift_step'] is not None:
+            print('Rollout drift in ',precision,' precision from step ',drift['drift_step'],' - using double precision')
+            pred_state_array = reference_state_array
+        return pred_state_array
 
-    # Calculate forward pass - saving results for state and rhs to array
-    pred_state_array = np.zeros(shape=(tsteps,state_len),dtype='double')
-    pred_state_array[0,:] = true_state_array[0,:]
-    temp_state = np.copy(true_state_array[0,:])
-    for i in range(1,tsteps):
-        time = np.reshape(time_array[i],(1,1))
-        output_state, output_rhs = euler_forward(temp_state,weights_1,weights_2,bias_1,bias_2,time)
-        pred_state_array[i,:] = output_state[:]
-        temp_state = np.copy(output_state)
+    return mode_rollout(theta_reshape(np.asarray(thetas,dtype='double')),init_states,num_steps,dt,ode_step,stats=stats,comm=comm)
 
-    return pred_state_array
+# Rollout of rollout_mode in the dtype of weights - the arguments of node.inference.rollout, parareal slices over comm
+def mode_rollout(weights,init_states,num_steps,dt,step,stats=None,dtype='double',comm=None):
+    if rollout_mode == 'parareal':
+        return parareal(weights,init_states,num_steps,dt,parareal_slices,step,get_integrator(parareal_coarse),parareal_coarse_factor,
+                        parareal_tolerance,comm=comm,stats=stats,dtype=dtype)
+    return rollout(weights,init_states,num_steps,dt,step,stats=stats,dtype=dtype)
+
+# thetas - parameters already in memory, read from weights_file when not given
+def forward_model(thetas=None):
+    if thetas is None:
+        thetas = np.load(weights_file)
+
+    # Calculate forward pass - one trajectory from the true initial condition
+    if rollout_mode == 'parareal': # collective - slices corrected on all ranks, with rank 0's parameters
+        thetas = broadcast_parameters(comm,thetas,root=0)
+        pred_state_array = model_rollout(thetas,true_state_array[0:1,:],tsteps,integrator_stats,comm)
+        rollout_cache.put(thetas,pred_state_array) # reused by the evaluations and the monitor of rank 0
+        return pred_state_array[0]
+    return rank_forward_model(thetas,integrator_stats)
+
+# forward_model of one rank (the monitor, the evaluations on rank 0) - reused when these thetas were evaluated
+def rank_forward_model(thetas,stats=None):
+    return rollout_cache.trajectory(thetas,tsteps,stats)[0]
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Training
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-thetas_optimal = rms_prop_optimize(thetas)
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# Saving and visualization
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-if rank == 0:
-    np.save('Trained_Weights.npy',thetas_optimal)
-    visualize(mode='test')
-    plt.show()
\ No newline at end of file
+# Configuration from the defaults above, argv (sys.argv[1:] when None) and its --config file, then ranks, data and network
+def configure(argv=None):
+    config = parse_config(defaults,argv,description='Data parallel neural ODE training (mpiexec or forked pool ranks)')
+    globals().update(config)
+    np.random.seed(seed)
+    start_ranks()
+    initialize()
+    return config
+
+# Data, derived settings, network, evaluation and monitor of the configuration in globals() on the ranks of comm
+def initialize():
+    load_data()
+    setup()
+    init_network()
+    init_evaluation()
+    if minibatch_mode == 'loop':
+        use_autograd()
+    init_monitor()
+
+# One training of a driver's configuration (NODE_Sweep.py) on the ranks of group - config overrides the defaults above
+# Returns the trained thetas as optimize/lbfgs_optimize, training_stats and the rollout state stay for the driver
+def train(config,group):
+    global comm, rank, nprocs
+    globals().update(defaults)
+    globals().update(config)
+    integrator_stats.clear()
+    training_stats.clear()
+    comm, rank, nprocs = group, group.Get_rank(), group.Get_size()
+    np.random.seed(seed)
+    initialize()
+    return lbfgs_optimize(thetas) if optimizer == 'lbfgs' else optimize(thetas)
+
+def main(argv=None):
+    configure(argv)
+    thetas_optimal = lbfgs_optimize(thetas) if optimizer == 'lbfgs' else optimize(thetas)
+    if rollout_mode == 'parareal': # the final rollout in parallel on all ranks - the rank 0 evaluations below reuse it
+        forward_model(thetas_optimal)
+
+    # Saving and visualization
+    if rank == 0:
+        if weights_file is not None:
+            np.save(weights_file,thetas_optimal)
+        if integrator_stats.get('forward_steps',0) > 0:
+            print('RHS evaluations per step - forward: ',integrator_stats['forward_nfev']/integrator_stats['forward_steps'],
+                  ' adjoint: ',integrator_stats['adjoint_nfev']/integrator_stats['adjoint_steps'])
+
+        # The predictor runs the exported precision without a reference - float64 when the reduced one drifts
+        export_dtype = work_dtype
+        if work_dtype != np.float64:
+            _, _, drift = rollout_drift(layout,thetas_optimal,true_state_array[0:1,:],tsteps,dt,ode_step,work_dtype,precision_tolerance)
+            print('Rollout drift of ',precision,' precision from double - max abs: ',drift['max_abs'],' relative: ',drift['relative'],
+                  ' beyond precision_tolerance from step: ',drift['drift_step'])
+            if drift['drift_step'] is not None:
+                export_dtype = np.float64
+        if model_file is not None:
+            export_model(model_file,thetas_optimal,layout.layer_sizes,dt,integrator,export_dtype,integrator_rtol,integrator_atol,
+                         metadata={'trained_by': 'NODE_MPI.py', 'tsteps': tsteps})
+
+        # Rollout errors of the trained model and the GP - the held-out range first, the trained range is a prefix of its rollout
+        evaluations = {}
+        if evaluator is not None:
+            evaluations['held_out'] = (evaluator.ranges,evaluator.evaluate(thetas_optimal))
+        evaluations['trained'] = (fit_evaluator.ranges,fit_evaluator.evaluate(thetas_optimal))
+        for name, (ranges, metrics) in evaluations.items():
+            print('Rollout relative error ',name,' ',ranges,' per mode: ',metrics['relative'],' mean: ',metrics['error'])
+            print('    GP relative error per mode: ',metrics['baseline_relative'],' mean: ',metrics['baseline_error'],
+                  ' skill (1 - rmse/GP rmse): ',metrics['skill'])
+        if evaluation_file is not None:
+            write_metrics(evaluation_file,evaluations)
+        monitor.close(thetas_optimal)
+
+    if profile:
+        print('Rank ',rank,' mean per epoch: ',timer.summary())
+    timer.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
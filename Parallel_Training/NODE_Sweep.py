@@ -0,0 +1,130 @@
+#'mpiexec -n 8 python NODE_Sweep.py' at command line - independent trainings of every sweep configuration on groups of group_size ranks
+# Options override the configuration below, e.g. '--group-size 2 --sweep-grid {"lr":[0.01,0.003]}', '--config sweep.json', '--help' lists them
+# Importing the script defines its functions without side effects - configure() splits the ranks and reads the data, main() sweeps
+# Every configuration is a NODE_MPI.py training (NODE_MPI.train - its setup and optimize) on the group's communicator
+import numpy as np
+import time
+
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from node.shards import load_time_major
+from node.sweep import configurations, split_groups, WorkQueue, gather_results, write_summary
+from node.config import parse_config, check_value
+from Parallel_Training import NODE_MPI
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Sweep definition - every combination of the sweep_grid values over sweep_defaults is one training, every name below is an option
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+_names = set(globals())
+group_size = 1 # ranks per configuration - gradients averaged every sync_interval epochs inside a group, as NODE_MPI.py
+sweep_defaults = {'num_neurons': 20, 'lr': 0.01, 'batch_tsteps': 10, 'num_batches': 10, 'seed': 10, 'optimizer': 'rmsprop',
+                  'lr_schedule': 'step', 'integrator': 'euler', 'num_epochs': 1000, 'validation_fraction': 0.2} # NODE_MPI.py options
+sweep_grid = {'num_neurons': [10,20,40], 'lr': [0.01,0.003], 'seed': [10,11,12,13]} # seeds alone - an ensemble of one configuration
+rank_key = 'rollout_error' # summary order - 'rollout_error' (full trajectory from the initial state), 'held_out_loss' or 'best_loss'
+summary_file = 'Sweep_Summary.json' # configurations, losses and timings, best first
+weights_file = 'Sweep_Weights.npz' # thetas of configuration i under 'config_i'
+ensemble_file = 'Sweep_Ensemble.npz' # rollouts of every configuration, their mean and standard deviation (None - not written)
+defaults = {name: value for name, value in globals().items() if name not in _names and not name.startswith('_')}
+
+# Settings of every training - the files of one training would be written by all groups at once
+member_settings = {'monitor_mode': 'off', 'weights_file': None, 'restart': False, 'restart_interval': 0, 'profile': False}
+
+# MPI Fluff - groups of group_size consecutive ranks of the launch
+def start_ranks():
+    global comm, rank, nprocs, group, group_rank
+    from mpi4py import MPI
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+    nprocs = comm.Get_size()
+    group = split_groups(comm,group_size)
+    group_rank = group.Get_rank()
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Uploading data - once per launch, the groups map the read-only time-major files (node.shards.load_time_major)
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+def load_data():
+    settings = dict(NODE_MPI.defaults,**sweep_defaults)
+    load_time_major(settings['data_file'],comm)
+    load_time_major(settings['gp_file'],comm)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# One configuration on the ranks of group
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Returns the summary and the trained thetas (the best held-out ones with validation_fraction > 0) on the group leader
+def train_configuration(config,group):
+    start_time = time.time()
+    thetas = NODE_MPI.train(dict(config,**member_settings),group)
+    pred_state_array = None
+    if group_rank == 0 or NODE_MPI.rollout_mode == 'parareal': # collective with parareal
+        pred_state_array = NODE_MPI.forward_model(thetas)
+    if group_rank != 0:
+        return None, None, None
+
+    stats = NODE_MPI.training_stats
+    summary = {'config': config, 'best_loss': stats['best_loss'], 'epochs': stats['epochs'], 'held_out_loss': stats['held_out_loss'],
+               'best_epoch': stats['best_epoch'],
+               'rollout_error': float(np.sqrt(np.mean((pred_state_array-NODE_MPI.true_state_array)**2))),
+               'group_size': group.Get_size(), 'seconds': time.time()-start_time}
+    return summary, np.asarray(thetas,dtype='double'), pred_state_array
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Sweep - idle groups take the next configuration until none are left, then the summary and ensemble on world rank 0
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Value of a NODE_MPI.py option in sweep_defaults or sweep_grid (node.config.check_value)
+def member_value(name,value):
+    if name not in NODE_MPI.defaults:
+        raise ValueError(name+' in sweep_defaults or sweep_grid is not a NODE_MPI.py option')
+    return check_value(name,value,NODE_MPI.defaults[name])
+
+# Configuration from the defaults above, argv (sys.argv[1:] when None) and its --config file, then ranks and data
+def configure(argv=None):
+    config = parse_config(defaults,argv,description='Hyperparameter sweeps and ensembles of NODE_MPI.py trainings on rank groups (mpiexec)')
+    config['sweep_defaults'] = {name: member_value(name,value) for name, value in config['sweep_defaults'].items()}
+    config['sweep_grid'] = {name: [member_value(name,value) for value in values] for name, values in config['sweep_grid'].items()}
+    globals().update(config)
+    start_ranks()
+    load_data()
+    return config
+
+def main(argv=None):
+    configure(argv)
+    configs = configurations(sweep_grid,sweep_defaults)
+    if rank == 0:
+        print('Sweep of ',len(configs),' configurations on ',(nprocs+group_size-1)//group_size,' groups of ',group_size,' ranks')
+
+    work_queue = WorkQueue(comm,group,len(configs))
+    results = []
+    rollouts = {}
+    index = work_queue.next()
+    while index is not None:
+        summary, thetas, pred_state_array = train_configuration(configs[index],group)
+        if group_rank == 0:
+            print('Configuration ',index,' ',configs[index],' rollout error: ',summary['rollout_error'],' in ',summary['seconds'],' s')
+            results.append((index,summary,thetas))
+            rollouts[index] = pred_state_array
+        index = work_queue.next()
+    work_queue.close()
+
+    results = gather_results(comm,results)
+    rollouts = comm.gather(rollouts,root=0)
+    if rank == 0:
+        summaries = write_summary(results,summary_file,weights_file,rank_key)
+        print('Best configuration: ',summaries[0]['config'],' ',rank_key,': ',summaries[0][rank_key])
+
+        if ensemble_file is not None:
+            rollouts = {index: pred_state_array for group_rollouts in rollouts for index, pred_state_array in group_rollouts.items()}
+            indices = [index for index, _, _ in results]
+            ensemble = np.asarray([rollouts[index] for index in indices])
+            np.savez(ensemble_file,rollouts=ensemble,mean=np.mean(ensemble,axis=0),std=np.std(ensemble,axis=0),indices=np.array(indices))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
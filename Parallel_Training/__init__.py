@@ -0,0 +1 @@
+# Training scripts - importable, 'python -m node.cli mpi' runs NODE_MPI.main
@@ -1,15 +1,109 @@
-import autograd.numpy as np
-import matplotlib.pyplot as plt
-from autograd import grad, jacobian, elementwise_grad
-from scipy.optimize import minimize
-
-np.random.seed(10)
-
+#'python NODE.py' or 'python -m node.cli serial' at command line - options override the configuration below, e.g.
+#'python NODE.py --tsteps 4000 --num-neurons 50 --monitor-mode off', 'python NODE.py --config run.json', '--help' lists them
+# Importing the script defines its functions without side effects - configure() sets up data and network, main() trains
+import numpy as np
+import multiprocessing
+
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from node.adjoint import mlp_vjp, adjoint_rhs_analytic
+from node.inference import rollout
+from node.layout import ParameterLayout
+from node.minibatch import neural_ode_batched, window_loss
+from node.backprop import neural_ode_backprop, select_gradient_engine
+from node.integrators import get_integrator
+from node.optimizers import get_schedule, get_optimizer, EarlyStopping, lbfgs
+from node.precision import get_dtype, WorkingCopy, rollout_drift
+from node.datagen import linear_trajectories, linear_rhs
+from node.parareal import parareal
+from node.evaluation import RolloutCache, Evaluator, write_metrics
+from node.predictor import export_model
+from node.monitor import Monitor, plot_spec
+from node.profiling import PhaseTimer
+from node.restart import RestartWriter, resume_state, set_rng_state
+from node.config import parse_config
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Configuration - defaults, every name below is an option (node/config.py)
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+_names = set(globals())
+seed = 10 # numpy RNG seed - Xavier initialization and window sampling
 tsteps = 2000
+final_time = 25.0 # dt = final_time/tsteps
 batch_tsteps = 10
 num_batches = 10
-dt = 25.0/tsteps
+num_epochs = 200
 reg_param = 0.0
+num_neurons = 30
+hidden_layers = None # widths of the hidden layers, None - [num_neurons], e.g. [30,30] for a deeper network
+adjoint_engine = 'analytic' # 'analytic' vector-Jacobian products or 'autograd' full Jacobians (for checking)
+minibatch_mode = 'batched' # 'batched' steps all windows together (analytic adjoint) or 'loop' one window at a time (imports autograd)
+integrator = 'euler' # 'euler', 'rk4' or adaptive 'dopri5' - used by the batched mode and forward_model ('loop' is Euler only)
+integrator_rtol = 1e-6 # dopri5 error control
+integrator_atol = 1e-8
+checkpoint_mode = 'full' # batched mode forward state storage - 'full', or 'stride'/'revolve' recomputation
+checkpoint_budget = None # number of states kept per window by 'stride'/'revolve'
+precision = 'double' # 'single' - float32 forward/adjoint sweeps and rollouts (batched mode)
+master_weights = True # with 'single' - the optimizer updates float64 thetas, the sweeps use a float32 copy
+precision_tolerance = 1e-3 # relative drift of the float32 rollout from float64 above which rollouts (and the exported model) use float64
+gradient_engine = 'auto' # batched mode - 'backprop' through the unrolled euler/rk4 window (exact gradient of the discrete loss),
+                         # 'adjoint' continuous adjoint (uses checkpoint_mode), 'auto' backprop when its tape fits in backprop_memory
+backprop_memory = 2**28 # bytes of stored stage states per epoch for 'auto'
+optimizer = 'rmsprop' # 'rmsprop', 'adam' or 'lbfgs' - full batch L-BFGS (scipy) over the fixed windows lbfgs_ids, no restart files
+lr = 0.01 # initial learning rate of rmsprop/adam
+lr_schedule = 'step' # 'step' (x0.9 every 100 epochs), 'cosine' (to zero at the last epoch) or 'constant'
+validation_fraction = 0.0 # trailing fraction of the trajectory held out - training windows end before it
+validation_metric = 'rollout' # held-out check - 'rollout' mean per-mode relative error of the rollout from t = 0 over the held-out
+                              # range (node/evaluation.py), 'windows' loss of held-out windows restarted from the truth
+validation_interval = 10 # epochs (L-BFGS iterations) between held-out losses
+early_stopping_patience = 20 # held-out losses without improvement before training stops and keeps the best parameters (0 - never)
+early_stopping_min_delta = 0.0 # relative improvement of the held-out loss below which a check counts as a plateau
+lbfgs_stride = 1 # the L-BFGS windows start every lbfgs_stride snapshots of the training range
+lbfgs_maxiter = 200
+rollout_mode = 'serial' # forward_model, evaluations and monitor - 'serial' steps, or 'parareal' time slices of fine steps corrected in parallel (node/parareal.py)
+parareal_slices = 32 # time slices of the rollout
+parareal_procs = 4 # processes running the fine slices
+parareal_coarse = 'rk4' # coarse propagator - integrator taking one step per parareal_coarse_factor fine steps
+parareal_coarse_factor = 20
+parareal_tolerance = 1e-6 # relative change of the slice start states at which the iteration stops
+model_file = 'Trained_Model.node' # standalone inference artifact of the trained model for node.predictor (None - not written)
+evaluation_file = 'Trained_Evaluation.json' # per-mode rollout errors of the trained model (None - not written)
+monitor_mode = 'inline' # 'inline' plots in the training loop, 'process' in a background window, 'thread' to PNG files, 'off' for headless runs
+monitor_interval = 0.0 # minimum seconds between plot updates
+restart = False # resume training from restart_file when it exists
+restart_file = 'Training_Restart.npz' # parameters, optimizer state, iteration and RNG state
+restart_interval = 50 # iterations between restart files (0 disables them)
+restart_async = True # restart and Trained_Weights.npy files are written on a background thread
+profile = False # per-epoch phase timings and evaluation counts, one JSON line per epoch in profile_file
+profile_file = 'Training_Profile.jsonl'
+defaults = {name: value for name, value in globals().items() if name not in _names and not name.startswith('_')}
+
+integrator_stats = {} # rhs evaluations and steps, accumulated over training
+parareal_pool = None # processes of the parareal fine slices - forked by the first parareal rollout, closed by main()
+
+# Settings derived from the configuration
+def setup():
+    global dt, ode_step, work_dtype, working_thetas, timer, validation_steps, num_train_starts, validation_ids, lbfgs_ids
+    dt = final_time/tsteps
+    ode_step = get_integrator(integrator,integrator_rtol,integrator_atol)
+    work_dtype = get_dtype(precision)
+    working_thetas = WorkingCopy(work_dtype)
+    timer = PhaseTimer(profile_file,enabled=profile)
+
+    if work_dtype != np.float64 and minibatch_mode != 'batched':
+        raise ValueError("precision = '"+precision+"' needs minibatch_mode = 'batched'")
+    if gradient_engine == 'backprop' and minibatch_mode != 'batched':
+        raise ValueError("gradient_engine = 'backprop' needs minibatch_mode = 'batched'")
+
+    # Training and held-out windows
+    validation_steps = int(validation_fraction*tsteps)
+    num_train_starts = tsteps - batch_tsteps - validation_steps # window starts sampled for training
+    validation_ids = np.arange(tsteps-validation_steps,tsteps-batch_tsteps+1,batch_tsteps) # non-overlapping held-out windows
+    lbfgs_ids = np.arange(0,num_train_starts,lbfgs_stride)
+    if num_train_starts <= 0 or (validation_steps > 0 and len(validation_ids) == 0):
+        raise ValueError('validation_fraction leaves no training or no held-out windows of batch_tsteps snapshots')
 
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -17,90 +111,67 @@ reg_param = 0.0
 # Generating dynamical system data
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def true_forward_solver(state,ds_mat):
-    i0 = state + dt*np.matmul(state,ds_mat)
-    return i0, np.matmul(i0,ds_mat)
-
 # State (z), rhs saver (f)
 state_len = 2
-true_state_array = np.zeros(shape=(tsteps,state_len),dtype='double') # 
-true_rhs_array = np.zeros(shape=(tsteps,state_len),dtype='double') #
-# Time array - fixed
-time_array = dt*np.arange(tsteps)
-
-
-# DS definition
-init_state = np.asarray([[2.0,0.0]])
-ds_mat = np.asarray([[-0.1, 2.0], [-2.0, -0.1]])
-
-true_state_array[0,:] = init_state[:]
-true_rhs_array[0,:] = np.matmul(init_state,ds_mat)[:]
-
-state = np.copy(init_state)
-for i in range(1,tsteps):
-    state_new, rhs_new = true_forward_solver(state,ds_mat)
-    true_state_array[i,:] = state_new[:]
-    true_rhs_array[i,:] = rhs_new[:]
-
-    state[:] = state_new[:]
-
-# Visualization fluff here
-fig, ax = plt.subplots(nrows=2,ncols=1)
-
-ax[0].set_title('Mode 1')
-ax[0].set_ylim(-4.0,4.0)
-ax[1].set_title('Mode 2')
-ax[1].set_ylim(-4.0,4.0)
-
-t1n1 = ax[0].plot(true_state_array[:,0],label='True')
-t1n2 = ax[1].plot(true_state_array[:,1],label='True')
 
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# Defining a neural network for parameterizing f(z,t) - for simplicity - assuming single layer
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# Define neural network parameters - simple 1-layer fc,ff nn - Xavier initialization
-num_neurons = 30
-weights_1 = np.random.randn(state_len,num_neurons)*np.sqrt(1.0/(state_len+num_neurons)) 
-weights_2 = np.random.randn(num_neurons,state_len)*np.sqrt(1.0/(state_len+num_neurons))  
-bias_1 = np.random.randn(1,num_neurons)*np.sqrt(1.0/(num_neurons))
-bias_2 = np.random.randn(1,state_len)*np.sqrt(1.0/(state_len))
-# Flatten (and reshape) parameters for the purpose of autograd
-thetas = np.concatenate((weights_1.flatten(),bias_1.flatten(),weights_2.flatten(),bias_2.flatten()),axis=0)
-num_wb = np.shape(thetas)[0]
-thetas = np.reshape(thetas,newshape=(1,num_wb))
-
-# Reshaping indices
-w1_idx_end = num_neurons*(state_len) # not inclusive
-b1_idx_start = num_neurons*(state_len)
-b1_idx_end = num_neurons*(state_len) + num_neurons
-
-w2_idx_start = num_neurons*(state_len) + num_neurons
-w2_idx_end = num_neurons*(state_len) + num_neurons + num_neurons*state_len
-
-b2_idx_start = num_neurons*(state_len) + num_neurons + num_neurons*state_len
-
-# Reshaping function for parameters
+def load_data():
+    global time_array, init_state, ds_mat, true_state_array, true_rhs_array
+    # Time array - fixed
+    time_array = dt*np.arange(tsteps)
+
+    # DS definition
+    init_state = np.asarray([[2.0,0.0]])
+    ds_mat = np.asarray([[-0.1, 2.0], [-2.0, -0.1]])
+
+    # Forward Euler trajectory in closed form (powers of I + dt*ds_mat) - (tsteps,state_len) arrays
+    true_state_array = linear_trajectories(init_state,ds_mat,tsteps,dt,discretization='euler')[0]
+    true_rhs_array = linear_rhs(true_state_array,ds_mat)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Defining a neural network for parameterizing f(z,t) - tanh MLP, single hidden layer by default
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Define neural network parameters - fc,ff tanh nn - Xavier initialization
+def init_network():
+    global layout, thetas, num_wb, gradient_mode
+    layout = ParameterLayout([state_len]+(hidden_layers or [num_neurons])+[state_len]) # all weights and biases in one flat (1,num_wb) buffer
+    thetas = layout.xavier()
+    if not master_weights:
+        thetas = thetas.astype(work_dtype) # optimizer in the reduced precision as well
+    num_wb = layout.num_wb
+    gradient_mode = 'adjoint'
+    if minibatch_mode == 'batched':
+        gradient_mode = select_gradient_engine(gradient_engine,ode_step,batch_tsteps,len(lbfgs_ids) if optimizer == 'lbfgs' else num_batches,
+                                               state_len,work_dtype,checkpoint_mode,backprop_memory)
+    print('Gradient engine: ',gradient_mode)
+
+# Rollouts of the trained range and the held-out range, sharing the trajectories of the same thetas (node/evaluation.py)
+def init_evaluation():
+    global rollout_cache, fit_evaluator, evaluator
+    rollout_cache = RolloutCache(layout,true_state_array[0:1,:],dt,ode_step,max_entries=early_stopping_patience+2, # keeps the best thetas
+                                 rollout_function=model_rollout)
+    fit_evaluator = Evaluator(rollout_cache,true_state_array,[(0,tsteps-validation_steps)])
+    evaluator = Evaluator(rollout_cache,true_state_array,[(tsteps-validation_steps,tsteps)]) if validation_steps > 0 else None
+
+# Visualization fluff here - matplotlib is imported by the monitor unless monitor_mode = 'off'
+# Plots forward_model - started (forked with monitor_mode = 'process') once the network and the rollout cache exist
+def init_monitor():
+    global monitor
+    monitor = Monitor(monitor_mode,plot_spec(true_state_array[0:1,:],tsteps,dt,integrator,num_modes=2,
+                                             references=[('True',None,true_state_array,None)],ylim=(-4.0,4.0)),monitor_interval,
+                      predict=forward_model)
+
+# Reshaping function for parameters - per-layer (W,b) views of the flat buffer, no copies
 def theta_reshape(thetas):
-    weights_1_flattened = thetas[0,0:w1_idx_end]
-    bias_1_flattened = thetas[0,b1_idx_start:b1_idx_end]
-
-    weights_2_flattened = thetas[0,w2_idx_start:w2_idx_end]
-    bias_2_flattened = thetas[0,b2_idx_start:]
-
-    weights_1 = np.reshape(weights_1_flattened,(state_len,num_neurons))
-    weights_2 = np.reshape(weights_2_flattened,(num_neurons,state_len))
-
-    bias_1 = np.reshape(bias_1_flattened,(1,num_neurons))
-    bias_2 = np.reshape(bias_2_flattened,(1,state_len))
-
-    return weights_1, weights_2, bias_1, bias_2
+    return layout.views(thetas)
 
 # Simple Feed forward network for RHS calculation
-def ffnn(state,weights_1,weights_2,bias_1,bias_2):
-    h = np.tanh(np.matmul(state,weights_1)+bias_1)
-    return np.matmul(h,weights_2)+bias_2
+def ffnn(state,layers):
+    h = state
+    for weights, bias in layers[:-1]:
+        h = np.tanh(np.matmul(h,weights)+bias)
+    return np.matmul(h,layers[-1][0])+layers[-1][1]
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -108,11 +179,11 @@ def ffnn(state,weights_1,weights_2,bias_1,bias_2):
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Forward model (Neural ODE formulation) - one timestep
-def euler_forward(state,weights_1,weights_2,bias_1,bias_2,time):
+def euler_forward(state,layers,time):
     # Step 1
-    i0 = state + dt*ffnn(state,weights_1,weights_2,bias_1,bias_2)
+    i0 = state + dt*ffnn(state,layers)
     # Output for saving state
-    f_rhs = ffnn(i0,weights_1,weights_2,bias_1,bias_2)
+    f_rhs = ffnn(i0,layers)
 
     return i0, f_rhs
 
@@ -126,30 +197,22 @@ def euler_forward(state,weights_1,weights_2,bias_1,bias_2,time):
 def training_loss_state(state,true_state):
     loss = np.sum((state - true_state)**2)
     return loss
-# Its gradient
-dldz_func = elementwise_grad(training_loss_state,0) # Output is a (1,state_len) array
 # Secondly as a function of pvec (a concatenated vector of state,thetas,time)
 def training_loss(pvec,true_state):
     _state = np.reshape(pvec[:,:state_len],(1,state_len)) # The state
     _thetas = np.reshape(pvec[:,state_len:-1],(1,num_wb)) # NN Parameters
     _time = np.reshape(pvec[:,-1],(1,1)) # Time
-    _weights_1, _weights_2, _bias_1, _bias_2 = theta_reshape(_thetas)
-    _output_state, _ = euler_forward(_state,_weights_1,_weights_2, _bias_1, _bias_2,_time)
+    _output_state, _ = euler_forward(_state,theta_reshape(_thetas),_time)
     loss = np.sum((_output_state - true_state)**2)
     return loss
-# Its gradient
-dl_func = elementwise_grad(training_loss,0) # Output is a (1,state_len+num_wb+1) array
 # Now we define the parameterization (i.e., the rhs of the ODE in terms of an NN - f(z))
 def rhs_calculator(pvec):
     _state = np.reshape(pvec[:,:state_len],(1,state_len)) # The state
     _thetas = np.reshape(pvec[:,state_len:-1],(1,num_wb)) # NN Parameters
     _time = np.reshape(pvec[:,-1],(1,1)) # Time    
-    _weights_1, _weights_2, _bias_1, _bias_2 = theta_reshape(_thetas)
-    rhs = ffnn(_state,_weights_1,_weights_2, _bias_1, _bias_2)
+    rhs = ffnn(_state,theta_reshape(_thetas))
     rhs = rhs.flatten()
     return rhs
-# Calculate Jacobians - dfdz, dfdthetas, dfdt
-df_func = jacobian(rhs_calculator) # Output is a (state_len,1,state_len+num_wb+1) array - must be squeezed as needed
 # Adjoint RHS calculation
 def adjoint_rhs(a,pvec):
     # Time to calculate Jacobians
@@ -164,23 +227,42 @@ def adjoint_rhs(a,pvec):
 
     return rhs_reverse
 
+# Gradients and Jacobians of the functions above ('loop' mode) - numpy is replaced by autograd's traceable wrapper
+def use_autograd():
+    global np, dldz_func, dl_func, df_func
+    import autograd.numpy as np
+    from autograd import elementwise_grad, jacobian
+    dldz_func = elementwise_grad(training_loss_state,0) # Output is a (1,state_len) array
+    dl_func = elementwise_grad(training_loss,0) # Output is a (1,state_len+num_wb+1) array
+    # Calculate Jacobians - dfdz, dfdthetas, dfdt
+    df_func = jacobian(rhs_calculator) # Output is a (state_len,1,state_len+num_wb+1) array - must be squeezed as needed
+
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Neural ODE algorithm - minibatching
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def neural_ode(thetas):
-    weights_1, weights_2, bias_1, bias_2 = theta_reshape(thetas) # Reshape once for utilization in entire iteration
-    batch_state_array = np.zeros(shape=(num_batches,batch_tsteps,state_len),dtype='double') # 
-    batch_rhs_array = np.zeros(shape=(num_batches,batch_tsteps,state_len),dtype='double') #
-    batch_time_array = np.zeros(shape=(num_batches,batch_tsteps,1),dtype='double') #
+# batch_ids - window starts, num_batches random training windows when not given
+def neural_ode(thetas,batch_ids=None):
+    layers = theta_reshape(working_thetas(thetas)) # Reshape once for utilization in entire iteration
+    if batch_ids is None:
+        batch_ids = np.random.choice(num_train_starts,num_batches)
+
+    if minibatch_mode == 'batched':
+        if gradient_mode == 'backprop':
+            return neural_ode_backprop(layers,true_state_array,batch_ids,batch_tsteps,dt,ode_step,integrator_stats,timer)
+        return neural_ode_batched(layers,true_state_array,batch_ids,batch_tsteps,dt,ode_step,integrator_stats,
+                                  checkpoint_mode,checkpoint_budget,timer)
+
+    batch_state_array = np.zeros(shape=(len(batch_ids),batch_tsteps,state_len),dtype='double') # 
+    batch_rhs_array = np.zeros(shape=(len(batch_ids),batch_tsteps,state_len),dtype='double') #
+    batch_time_array = np.zeros(shape=(len(batch_ids),batch_tsteps,1),dtype='double') #
 
     augmented_state = np.zeros(shape=(1,state_len+num_wb+1))
-    batch_ids = np.random.choice(tsteps-batch_tsteps,num_batches)
 
     # Minibatching within sampled domain
     total_batch_loss = 0.0
-    for j in range(num_batches):
+    for j in range(len(batch_ids)):
         start_id = batch_ids[j]
         end_id = start_id + batch_tsteps
 
@@ -189,13 +271,15 @@ def neural_ode(thetas):
         batch_time_array[j,:batch_tsteps] = time_array[start_id:end_id,None]
 
         # Calculate forward pass - saving results for state and rhs to array - batchwise
-        temp_state = np.copy(batch_state_array[j,0,:])
-        for i in range(1,batch_tsteps):
-            time = np.reshape(batch_time_array[j,i],newshape=(1,1))
-            output_state, output_rhs = euler_forward(temp_state,weights_1,weights_2,bias_1,bias_2,time)  
-            batch_state_array[j,i,:] = output_state[:]
-            batch_rhs_array[j,i,:] = output_rhs[:]
-            temp_state = np.copy(output_state)
+        with timer.phase('forward'):
+            temp_state = np.copy(batch_state_array[j,0,:])
+            for i in range(1,batch_tsteps):
+                time = np.reshape(batch_time_array[j,i],newshape=(1,1))
+                output_state, output_rhs = euler_forward(temp_state,layers,time)  
+                batch_state_array[j,i,:] = output_state[:]
+                batch_rhs_array[j,i,:] = output_rhs[:]
+                temp_state = np.copy(output_state)
+        timer.count('forward_rhs',2*(batch_tsteps-1)) # euler_forward also returns the rhs at the new state
 
         # Operations at final time step (setting up initial conditions for the adjoint)
         temp_state = np.copy(batch_state_array[j,-2,:])
@@ -203,110 +287,210 @@ def neural_ode(thetas):
         time = np.reshape(batch_time_array[j,-2],(1,1)) # prefinal time
         pvec = np.concatenate((temp_state,thetas,time),axis=1)
 
-        # Calculate loss related gradients - dldz
-        dldz = np.reshape(dldz_func(output_state,true_state_array[end_id-1,:]),(1,state_len))
-        # With respect to weights,bias and time
-        dl = dl_func(pvec,true_state_array[end_id-1,:])
-        dldthetas = np.reshape(dl[:,state_len:-1],newshape=(1,num_wb))
-        # Calculate dl/dt
-        dldt = np.matmul(dldz,batch_rhs_array[j,-1,:])
-        dldt = np.reshape(dldt,newshape=(1,1))
+        with timer.phase('loss_gradient'):
+            # Calculate loss related gradients - dldz
+            dldz = np.reshape(dldz_func(output_state,true_state_array[end_id-1,:]),(1,state_len))
+            # With respect to weights,bias and time
+            if adjoint_engine == 'analytic':
+                _, dldthetas = mlp_vjp(dldz,temp_state,layers)
+                dldthetas = dt*dldthetas
+            else:
+                dl = dl_func(pvec,true_state_array[end_id-1,:])
+                dldthetas = np.reshape(dl[:,state_len:-1],newshape=(1,num_wb))
+            # Calculate dl/dt
+            dldt = np.matmul(dldz,batch_rhs_array[j,-1,:])
+            dldt = np.reshape(dldt,newshape=(1,1))
+        timer.count('loss_gradient',2)
 
         # Find batch loss
         total_batch_loss = total_batch_loss + np.sum((output_state-true_state_array[end_id-1,:])**2)
 
         # Reverse operation (adjoint evolution in backward time)
-        _augmented_state = np.concatenate((dldz,dldthetas,dldt),axis=1)
-        for i in range(1,batch_tsteps):
-            time = np.reshape(batch_time_array[j,-1-i],newshape=(1,1))
-            state_now = np.reshape(batch_state_array[j,-1-i,:],newshape=(1,state_len))
-            pvec = np.concatenate((state_now,thetas,time),axis=1)
-
-            # Adjoint propagation backward in time
-            i0 = _augmented_state + dt*adjoint_rhs(_augmented_state,pvec)
-            sub_state = np.reshape(i0[0,:state_len],newshape=(1,state_len))
-
-            _augmented_state[:,:] = i0[:,:]
+        with timer.phase('adjoint'):
+            _augmented_state = np.concatenate((dldz,dldthetas,dldt),axis=1)
+            for i in range(1,batch_tsteps):
+                time = np.reshape(batch_time_array[j,-1-i],newshape=(1,1))
+                state_now = np.reshape(batch_state_array[j,-1-i,:],newshape=(1,state_len))
+
+                # Adjoint propagation backward in time
+                if adjoint_engine == 'analytic':
+                    i0 = _augmented_state + dt*adjoint_rhs_analytic(_augmented_state,state_now,layers)
+                else:
+                    pvec = np.concatenate((state_now,thetas,time),axis=1)
+                    i0 = _augmented_state + dt*adjoint_rhs(_augmented_state,pvec)
+                sub_state = np.reshape(i0[0,:state_len],newshape=(1,state_len))
+
+                _augmented_state[:,:] = i0[:,:]
+        timer.count('adjoint_vjp' if adjoint_engine == 'analytic' else 'jacobian',batch_tsteps-1)
         
         augmented_state = np.add(augmented_state,_augmented_state)
     
     return augmented_state, total_batch_loss
 
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# Visualization function
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def visualize(mode='train'):
-    predicted_states = forward_model()
-    # Visualization of modal evolution
-    ln1, = ax[0].plot(predicted_states[:,0],label='ML',color='orange')
-    ln2, = ax[1].plot(predicted_states[:,1],label='ML',color='orange')
-
-    plt.legend()
-    plt.pause(0.01)
-    plt.draw()
+# Rollout error over the held-out range, or forward sweeps over the held-out windows alone
+def validation_loss(thetas):
+    if validation_metric == 'rollout':
+        return evaluator.evaluate(thetas)['error']
+    return window_loss(theta_reshape(working_thetas(thetas)),true_state_array,validation_ids,batch_tsteps,dt,ode_step)
 
-    if mode=='train':
-       ln1.remove()
-       ln2.remove()
-    
-        
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Optimization
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def rms_prop_optimize(thetas):
-    num_epochs = 200
-    lr = 0.01
-    beta = 0.9
-    lr_counter = 0
-    exp_gradient = np.zeros(shape=(1,num_wb))
+def optimize(thetas):
+    opt = get_optimizer(optimizer,get_schedule(lr_schedule,lr,num_epochs))
+    early_stopping = EarlyStopping(early_stopping_patience,early_stopping_min_delta)
     best_loss = np.Inf
     loss_list = []
-    for epoch in range(num_epochs):
+    start_epoch = 0
+
+    if restart:
+        state = resume_state(restart_file)
+        if state is not None:
+            thetas, best_loss = state['thetas'], float(state['best_loss'])
+            opt.load_state(state)
+            early_stopping.load_state(state)
+            loss_list = list(state['loss_list'])
+            start_epoch = int(state['epoch']) + 1
+            set_rng_state(state)
+            print('Resuming from iteration: ',start_epoch)
+
+    restart_writer = RestartWriter(restart_interval,restart_async,last_epoch=start_epoch-1)
+    for epoch in range(start_epoch,num_epochs):
         augmented_state, total_batch_loss = neural_ode(thetas)      
               
-        if epoch == 0:
-            exp_gradient = (1.0-beta)*(augmented_state[0,state_len:-1]**2)
-        else:
-            exp_gradient = beta*exp_gradient + (1.0-beta)*(augmented_state[0,state_len:-1]**2)
-
-        thetas = thetas - lr/(np.sqrt(exp_gradient))*(augmented_state[0,state_len:-1])
-        lr_counter = lr_counter + 1
+        with timer.phase('optimizer'):
+            thetas = thetas - opt.update(augmented_state[0,state_len:-1])
 
         if total_batch_loss<best_loss:
-            np.save('Trained_Weights.npy',thetas)
-            visualize()
+            if len(validation_ids) == 0: # otherwise the weights with the best held-out loss are saved
+                with timer.phase('save'):
+                    restart_writer.save_weights('Trained_Weights.npy',thetas)
+            with timer.phase('plot'):
+                monitor.update(thetas)
             best_loss = total_batch_loss
 
         print('iteration: ',epoch,' Loss: ',best_loss)
         loss_list.append(total_batch_loss)
-        
-        if lr_counter > 100:
-            lr = lr*0.9
-            lr_counter = 0
 
+        stop = False
+        if len(validation_ids) > 0 and epoch % validation_interval == 0:
+            with timer.phase('validation'):
+                held_out_loss = validation_loss(thetas)
+            stop = early_stopping.update(epoch,held_out_loss,thetas)
+            print('iteration: ',epoch,' Held-out loss: ',held_out_loss)
+            if early_stopping.best_epoch == epoch:
+                with timer.phase('save'):
+                    restart_writer.save_weights('Trained_Weights.npy',thetas)
+
+        if restart_writer.due(epoch):
+            with timer.phase('save'):
+                restart_writer.save(restart_file,epoch,thetas=thetas,best_loss=best_loss,loss_list=loss_list,**opt.state(),
+                                    **early_stopping.state())
+
+        timer.end_epoch(epoch,loss=total_batch_loss)
+        if stop:
+            print('Early stopping at iteration: ',epoch,' - best held-out loss ',early_stopping.best_loss,' at iteration: ',
+                  early_stopping.best_epoch)
+            break
+
+    restart_writer.close()
+    if early_stopping.best_thetas is not None:
+        thetas = early_stopping.best_thetas
+    return thetas, loss_list
+
+# Full batch L-BFGS over the windows starting at lbfgs_ids - the same deterministic loss in every line search
+def lbfgs_optimize(thetas):
+    early_stopping = EarlyStopping(early_stopping_patience,early_stopping_min_delta)
+    loss_list = []
+    last = {'loss': np.Inf}
+
+    def loss_and_gradient(thetas):
+        augmented_state, total_batch_loss = neural_ode(thetas,lbfgs_ids)
+        last['loss'] = total_batch_loss
+        return total_batch_loss, augmented_state[0,state_len:-1]
+
+    # After every iteration - the last evaluation was at the accepted parameters
+    def callback(iteration,thetas):
+        if len(validation_ids) == 0: # otherwise the weights with the best held-out loss are saved
+            with timer.phase('save'):
+                np.save('Trained_Weights.npy',thetas)
+        with timer.phase('plot'):
+            monitor.update(thetas)
+        print('iteration: ',iteration,' Loss: ',last['loss'])
+        loss_list.append(last['loss'])
+
+        stop = False
+        if len(validation_ids) > 0 and iteration % validation_interval == 0:
+            with timer.phase('validation'):
+                held_out_loss = validation_loss(thetas)
+            stop = early_stopping.update(iteration,held_out_loss,thetas)
+            print('iteration: ',iteration,' Held-out loss: ',held_out_loss)
+            if early_stopping.best_epoch == iteration:
+                with timer.phase('save'):
+                    np.save('Trained_Weights.npy',thetas)
+        timer.end_epoch(iteration,loss=last['loss'])
+        return stop
+
+    thetas, result = lbfgs(loss_and_gradient,thetas,lbfgs_maxiter,callback)
+    if result is None:
+        print('Early stopping - best held-out loss ',early_stopping.best_loss,' at iteration: ',early_stopping.best_epoch)
+    else:
+        print('L-BFGS: ',result.message)
+    if early_stopping.best_thetas is not None:
+        thetas = early_stopping.best_thetas
     return thetas, loss_list
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Forward model
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def forward_model():
-    thetas = np.load('Trained_Weights.npy')
-    weights_1, weights_2, bias_1, bias_2 = theta_reshape(thetas)
-
-    # Calculate forward pass - saving results for state and rhs to array
-    pred_state_array = np.zeros(shape=(tsteps,state_len),dtype='double')
-    pred_state_array[0,:] = true_state_array[0,:]
-    temp_state = np.copy(true_state_array[0,:])
-    for i in range(1,tsteps):
-        time = np.reshape(time_array[i],(1,1))
-        output_state, output_rhs = euler_forward(temp_state,weights_1,weights_2,bias_1,bias_2,time)
-        pred_state_array[i,:] = output_state[:]
-        temp_state = np.copy(output_state)
+# Every rollout of the script - forward_model, the rollout evaluations (through rollout_cache) and the monitor
+# init_states (num_traj,state_len), returns (num_traj,num_steps,state_len) trajectories
+def model_rollout(thetas,init_states,num_steps,stats=None):
+    if work_dtype != np.float64: # Reduced precision rollout, guarded by the float64 one
+        pred_state_array, reference_state_array, drift = rollout_drift(layout,thetas,init_states,num_steps,dt,ode_step,work_dtype,
+                                                                       precision_tolerance,stats,mode_rollout)
+        if drift['drift_step'] is not None:
+            print('Rollout drift in ',precision,' precision from step ',drift['drift_step'],' - using double precision')
+            pred_state_array = reference_state_array
+        return pred_state_array
+
+    return mode_rollout(theta_reshape(np.asarray(thetas,dtype='double')),init_states,num_steps,dt,ode_step,stats=stats)
+
+# Rollout of rollout_mode in the dtype of weights - the arguments of node.inference.rollout
+def mode_rollout(weights,init_states,num_steps,dt,step,stats=None,dtype='double'):
+    if rollout_mode == 'parareal':
+        if multiprocessing.current_process().daemon: # the monitor's process cannot start a pool - the slices run in turn
+            return parareal_rollout(weights,init_states,num_steps,stats,dtype=dtype)
+        return parareal_rollout(weights,init_states,num_steps,stats,get_parareal_pool(),dtype)
+    return rollout(weights,init_states,num_steps,dt,step,stats=stats,dtype=dtype)
+
+def get_parareal_pool():
+    global parareal_pool
+    if parareal_pool is None:
+        parareal_pool = multiprocessing.get_context('fork').Pool(parareal_procs)
+    return parareal_pool
+
+def close_parareal_pool():
+    global parareal_pool
+    if parareal_pool is not None:
+        parareal_pool.close()
+        parareal_pool.join()
+        parareal_pool = None
+
+def parareal_rollout(weights,init_states,num_steps,stats=None,pool=None,dtype='double'):
+    return parareal(weights,init_states,num_steps,dt,parareal_slices,ode_step,get_integrator(parareal_coarse),parareal_coarse_factor,
+                    parareal_tolerance,pool=pool,stats=stats,dtype=dtype)
+
+# thetas - parameters already in memory, read from Trained_Weights.npy when not given
+def forward_model(thetas=None):
+    if thetas is None:
+        thetas = np.load('Trained_Weights.npy')
+
+    # Calculate forward pass - one trajectory from the true initial condition, reused when these thetas were evaluated
+    pred_state_array = rollout_cache.trajectory(thetas,tsteps,integrator_stats)[0]
 
     return pred_state_array
 
@@ -315,18 +499,59 @@ def forward_model():
 # Training
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-thetas_optimal, loss_list = rms_prop_optimize(thetas)
-np.save('Trained_Weights.npy',thetas_optimal)
-
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# Visualization
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-visualize(mode='test')
-plt.show()
-
-plt.figure()
-plt.title('Convergence')
-plt.semilogy(np.asarray(loss_list))
-plt.show()
\ No newline at end of file
+# Configuration from the defaults above, argv (sys.argv[1:] when None) and its --config file, then data and network
+def configure(argv=None):
+    config = parse_config(defaults,argv,description='Serial neural ODE training')
+    globals().update(config)
+    setup()
+    np.random.seed(seed)
+    load_data()
+    init_network()
+    init_evaluation()
+    if minibatch_mode == 'loop':
+        use_autograd()
+    init_monitor()
+    return config
+
+def main(argv=None):
+    configure(argv)
+    thetas_optimal, loss_list = lbfgs_optimize(thetas) if optimizer == 'lbfgs' else optimize(thetas)
+    np.save('Trained_Weights.npy',thetas_optimal)
+
+    if integrator_stats.get('forward_steps',0) > 0:
+        print('RHS evaluations per step - forward: ',integrator_stats['forward_nfev']/integrator_stats['forward_steps'],
+              ' adjoint: ',integrator_stats['adjoint_nfev']/integrator_stats['adjoint_steps'])
+
+    # The predictor runs the exported precision without a reference - float64 when the reduced one drifts
+    export_dtype = work_dtype
+    if work_dtype != np.float64:
+        _, _, drift = rollout_drift(layout,thetas_optimal,true_state_array[0:1,:],tsteps,dt,ode_step,work_dtype,precision_tolerance)
+        print('Rollout drift of ',precision,' precision from double - max abs: ',drift['max_abs'],' relative: ',drift['relative'],
+              ' beyond precision_tolerance from step: ',drift['drift_step'])
+        if drift['drift_step'] is not None:
+            export_dtype = np.float64
+    if model_file is not None:
+        export_model(model_file,thetas_optimal,layout.layer_sizes,dt,integrator,export_dtype,integrator_rtol,integrator_atol,
+                     metadata={'trained_by': 'NODE.py', 'tsteps': tsteps})
+
+    # Rollout errors of the trained model - the held-out range first, the trained range is a prefix of its rollout
+    evaluations = {}
+    if evaluator is not None:
+        evaluations['held_out'] = (evaluator.ranges,evaluator.evaluate(thetas_optimal))
+    evaluations['trained'] = (fit_evaluator.ranges,fit_evaluator.evaluate(thetas_optimal))
+    for name, (ranges, metrics) in evaluations.items():
+        print('Rollout relative error ',name,' ',ranges,' per mode: ',metrics['relative'],' mean: ',metrics['error'])
+    if evaluation_file is not None:
+        write_metrics(evaluation_file,evaluations)
+
+    if profile:
+        print('Mean per epoch: ',timer.summary())
+    timer.close()
+
+    # Visualization
+    monitor.close(thetas_optimal,loss_list)
+    close_parareal_pool()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
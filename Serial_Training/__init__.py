@@ -0,0 +1 @@
+# Training scripts - importable, 'python -m node.cli serial' runs NODE.main
@@ -0,0 +1 @@
+# Shared numerics for the Neural ODE training scripts (Serial_Training/NODE.py, Parallel_Training/NODE_MPI.py)
@@ -0,0 +1,83 @@
+import numpy as np
+
+from node.model import mlp
+from node.layout import ParameterLayout
+from node.integrators import euler_step
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Analytic adjoint for the tanh MLP f(z) = tanh(...tanh(z W1 + b1)...) Wn + bn
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# The reverse sweep only ever needs a.df/dz and a.df/dthetas, so the full (state_len,state_len+num_wb+1)
+# Jacobian is never formed - cost is that of two extra matmuls per layer.
+
+# Vector-Jacobian products of the MLP
+# a, state - (rows,state_len) - one adjoint row per state row
+# out - optional (1,num_wb) buffer the parameter gradient is written into (layout of node.layout.ParameterLayout)
+# Everything stays in the dtype of a and state (float32 with precision='single')
+# Returns a.df/dz - (rows,state_len) and a.df/dthetas - (1,num_wb) summed over rows
+def mlp_vjp(a,state,layers,out=None):
+    layout = ParameterLayout.from_layers(layers)
+    if out is None:
+        out = layout.zeros(np.result_type(a,state))
+    gradients = layout.views(out)
+
+    activations = [state]
+    for weights, bias in layers[:-1]:
+        activations.append(np.tanh(np.matmul(activations[-1],weights)+bias))
+
+    g = a
+    for k in range(len(layers)-1,-1,-1):
+        weights = layers[k][0]
+        np.matmul(activations[k].T,g,out=gradients[k][0])
+        np.sum(g,axis=0,keepdims=True,out=gradients[k][1])
+        g = np.matmul(g,weights.T)
+        if k > 0:
+            g = g*(1.0-activations[k]**2) # Back through the tanh layer
+
+    return g, out
+
+# Adjoint RHS with the same layout as the augmented state (a.df/dz, a.df/dthetas, a.df/dt)
+# a - (1,state_len+num_wb+1) augmented adjoint, state - (1,state_len) state at which the Jacobians are evaluated
+def adjoint_rhs_analytic(a,state,layers):
+    state_len = np.shape(state)[1]
+    out = np.zeros(shape=np.shape(a),dtype=a.dtype)
+    a_dfdz, _ = mlp_vjp(a[:,:state_len],state,layers,out=out[:,state_len:-1])
+    out[:,:state_len] = a_dfdz # a.df/dt stays zero - f has no explicit time dependence
+
+    return out
+
+# One reverse step of the adjoint from time level k (state z_now) to k-1 (state z_prev) with the integrator step
+# a_z - (rows,state_len). Returns a_z at level k-1, the a.df/dthetas increment (1,num_wb) and rhs evaluations used
+# out - optional (1,num_wb) buffer for the increment (Euler writes it in place, no per-step allocation)
+# Euler keeps the discrete adjoint of the forward Euler map (Jacobians at the stored earlier state z_prev).
+# Other schemes integrate the augmented system [z, a_z, a_thetas] backward from z_now (Chen et al. 2018),
+# re-anchored on the stored forward state every step so that the reversed state does not drift.
+def adjoint_step(step,a_z,z_now,z_prev,layers,dt,out=None):
+    if step is euler_step:
+        a_dfdz, a_dfdthetas = mlp_vjp(a_z,z_prev,layers,out=out)
+        a_dfdthetas *= dt
+        return a_z + dt*a_dfdz, a_dfdthetas, 1
+
+    shape = np.shape(a_z)
+    nz = np.size(a_z)
+    num_wb = ParameterLayout.from_layers(layers).num_wb
+    def augmented_rhs(y):
+        z = np.reshape(y[:nz],shape)
+        a = np.reshape(y[nz:2*nz],shape)
+        dydt = np.empty(2*nz+num_wb,dtype=a_z.dtype)
+        dydt[:nz] = mlp(z,layers).flatten()
+        a_dfdz, _ = mlp_vjp(a,z,layers,out=np.reshape(dydt[2*nz:],(1,num_wb)))
+        dydt[nz:2*nz] = a_dfdz.flatten()
+        dydt[nz:] *= -1.0
+        return dydt
+
+    y = np.concatenate((np.reshape(z_now,(-1,)),a_z.flatten(),np.zeros(num_wb,dtype=a_z.dtype)))
+    y, nfev = step(augmented_rhs,y,-dt)
+
+    a_thetas = np.reshape(y[2*nz:],(1,num_wb))
+    if out is not None:
+        out[:,:] = a_thetas
+        a_thetas = out
+    return np.reshape(y[nz:2*nz],shape), a_thetas, nfev
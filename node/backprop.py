@@ -0,0 +1,108 @@
+import numpy as np
+
+from node.model import mlp
+from node.adjoint import mlp_vjp
+from node.layout import ParameterLayout
+from node.integrators import euler_step, rk4_step
+from node.profiling import null_timer
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Discretize-then-optimize - reverse mode through the unrolled fixed-step integrator
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# The forward sweep keeps the stage inputs of every step (the tape), the reverse sweep pulls dL/dz back through each
+# Runge-Kutta stage with mlp_vjp - the exact gradient of the discrete window loss, whereas the adjoint of
+# node.minibatch integrates the continuous adjoint (and, as the original scripts, adds the last step's dL/dthetas a
+# second time)
+# Fixed-step explicit schemes only (euler, rk4) - dopri5's step size control is not differentiated
+# Tape memory: batch_tsteps-1 steps x stages x (num_batches,state_len) - selected by select_gradient_engine
+
+# Butcher tableaus (a, b) of the schemes in node.integrators
+tableaus = {euler_step: ([[]],[1.0]),
+            rk4_step: ([[],[0.5],[0.0,0.5],[0.0,0.0,1.0]],[1.0/6.0,1.0/3.0,1.0/3.0,1.0/6.0])}
+
+gradient_engines = ['auto','backprop','adjoint']
+
+def tape_bytes(step,batch_tsteps,num_batches,state_len,dtype='double'):
+    a, _ = tableaus[step]
+    return (batch_tsteps-1)*len(a)*num_batches*state_len*np.dtype(dtype).itemsize
+
+# 'backprop' or 'adjoint' for the requested engine - 'auto' takes backprop when the integrator is differentiable,
+# the adjoint is not asked to checkpoint (checkpoint_mode other than 'full' means memory is short) and the tape fits
+# in memory_budget bytes
+def select_gradient_engine(engine,step,batch_tsteps,num_batches,state_len,dtype='double',checkpoint_mode='full',
+                           memory_budget=2**28):
+    if engine not in gradient_engines:
+        raise ValueError('Unknown gradient engine {} - choose from {}'.format(engine,gradient_engines))
+    if engine == 'backprop' and step not in tableaus:
+        raise ValueError('backprop needs a fixed-step integrator (euler or rk4)')
+    if engine != 'auto':
+        return engine
+    if step not in tableaus or checkpoint_mode != 'full':
+        return 'adjoint'
+    return 'backprop' if tape_bytes(step,batch_tsteps,num_batches,state_len,dtype) <= memory_budget else 'adjoint'
+
+# Same arguments and result as node.minibatch.neural_ode_batched - summed augmented state (1,state_len+num_wb+1)
+# (dL/dz at the window starts, dL/dthetas, dL/dt) and the total batch loss
+# Profiled as the forward, loss_gradient and adjoint (reverse sweep) phases
+def neural_ode_backprop(layers,true_state_array,batch_ids,batch_tsteps,dt,step=euler_step,stats=None,timer=null_timer):
+    a, b = tableaus[step]
+    num_stages = len(a)
+    dtype = layers[0][0].dtype
+    rhs = lambda state: mlp(state,layers)
+
+    # Forward sweep - stage inputs of every step
+    state = np.asarray(true_state_array[batch_ids,:],dtype=dtype)
+    tape = []
+    with timer.phase('forward'):
+        for _ in range(batch_tsteps-1):
+            stage_states = []
+            k = []
+            for i in range(num_stages):
+                stage_state = state
+                for j in range(i):
+                    if a[i][j] != 0.0:
+                        stage_state = stage_state + dt*a[i][j]*k[j]
+                stage_states.append(stage_state)
+                k.append(rhs(stage_state))
+            tape.append(stage_states)
+            for i in range(num_stages):
+                state = state + dt*b[i]*k[i]
+    output_state = state
+    forward_nfev = (batch_tsteps-1)*num_stages
+
+    true_final_state = np.asarray(true_state_array[batch_ids+batch_tsteps-1,:],dtype=dtype)
+    with timer.phase('loss_gradient'):
+        dldz = 2.0*(output_state-true_final_state) # (num_batches,state_len)
+        dldt = np.reshape(np.sum(dldz*rhs(output_state)),(1,1))
+    total_batch_loss = np.sum((output_state-true_final_state)**2)
+
+    # Reverse sweep - y_new = y + dt*sum(b_i k_i), k_i = f(y + dt*sum(a_ij k_j))
+    a_z = dldz
+    a_thetas = ParameterLayout.from_layers(layers).zeros(dtype)
+    a_dthetas = np.zeros_like(a_thetas)
+    with timer.phase('adjoint'):
+        for stage_states in reversed(tape):
+            a_k = [dt*b[i]*a_z for i in range(num_stages)]
+            a_y = a_z
+            for i in range(num_stages-1,-1,-1):
+                a_stage, a_dthetas = mlp_vjp(a_k[i],stage_states[i],layers,out=a_dthetas)
+                a_thetas += a_dthetas
+                a_y = a_y + a_stage
+                for j in range(i):
+                    if a[i][j] != 0.0:
+                        a_k[j] = a_k[j] + dt*a[i][j]*a_stage
+            a_z = a_y
+
+    timer.count('forward_rhs',forward_nfev+1)
+    timer.count('adjoint_vjp',forward_nfev)
+
+    if stats is not None:
+        stats['forward_nfev'] = stats.get('forward_nfev',0) + forward_nfev
+        stats['forward_steps'] = stats.get('forward_steps',0) + batch_tsteps - 1
+        stats['adjoint_nfev'] = stats.get('adjoint_nfev',0) + forward_nfev
+        stats['adjoint_steps'] = stats.get('adjoint_steps',0) + batch_tsteps - 1
+
+    augmented_state = np.concatenate((np.sum(a_z,axis=0,keepdims=True),a_thetas,dldt),axis=1)
+    return augmented_state, total_batch_loss
@@ -0,0 +1,25 @@
+import os, sys
+import importlib
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Command line entry point of the training scripts
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# 'python -m node.cli serial --tsteps 4000 --monitor-mode off', 'mpiexec -n 4 python -m node.cli mpi --config run.json'
+# or 'mpiexec -n 8 python -m node.cli sweep --group-size 2'
+# The rest of the command line goes to the script's main (options in node/config.py, '--help' lists them). Relative
+# file names (data, restart, weights) are relative to the working directory
+
+scripts = {'serial': 'Serial_Training.NODE', 'mpi': 'Parallel_Training.NODE_MPI', 'sweep': 'Parallel_Training.NODE_Sweep'}
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) == 0 or argv[0] not in scripts:
+        print('usage: python -m node.cli {'+','.join(scripts)+'} [--config FILE] [--name VALUE ...]')
+        return 2
+    sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+    return importlib.import_module(scripts[argv[0]]).main(argv[1:])
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import numpy as np
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Parameter and gradient synchronization between MPI ranks - buffer based collectives only (no pickling, no rank 0 loops)
+# comm - an mpi4py communicator or a node.pool.PoolComm (local forked ranks), numpy buffers and the default sum
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Initial parameters from root to every rank - thetas must already have the right shape on all ranks
+def broadcast_parameters(comm,thetas,root=0):
+    thetas = np.ascontiguousarray(thetas,dtype='double')
+    comm.Bcast(thetas,root=root)
+    return thetas
+
+# Averages the parameter update and sums the batch loss over all ranks with a single Allreduce of one packed buffer
+# overlap=True - the Iallreduce is started at the sync epoch and only waited for in finish(), so that the caller can
+# run the next epoch's neural_ode while the reduction is in flight
+class GradientSync:
+    def __init__(self,comm,num_wb,overlap=False):
+        self.comm = comm
+        self.nprocs = comm.Get_size()
+        self.num_wb = num_wb
+        self.overlap = overlap
+        self.send_buffer = np.zeros(num_wb+1,dtype='double')
+        self.recv_buffer = np.zeros(num_wb+1,dtype='double')
+        self.request = None
+        self.local_update = None
+
+    def pending(self):
+        return self.local_update is not None
+
+    # del_theta - (num_wb,) local update, loss - local batch loss
+    def start(self,del_theta,loss):
+        self.send_buffer[:self.num_wb] = np.reshape(del_theta,(self.num_wb,))
+        self.send_buffer[-1] = loss
+        self.local_update = np.array(np.reshape(del_theta,(self.num_wb,))) # same dtype as the caller's thetas
+        if self.overlap:
+            self.request = self.comm.Iallreduce(self.send_buffer,self.recv_buffer)
+        else:
+            self.comm.Allreduce(self.send_buffer,self.recv_buffer)
+
+    # Returns the local update that was sent, the rank-averaged update (in the dtype sent) and the summed loss
+    def finish(self):
+        if self.request is not None:
+            self.request.Wait()
+            self.request = None
+        local_update = self.local_update
+        self.local_update = None
+        return local_update, (self.recv_buffer[:self.num_wb]/self.nprocs).astype(local_update.dtype), self.recv_buffer[-1]
@@ -0,0 +1,61 @@
+import sys
+import json
+import argparse
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Script configuration - the training scripts' module level defaults, overridden by a JSON file and command line options
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Every default is an option --name (dashes or underscores), e.g. --tsteps 4000 --integrator rk4 --hidden-layers [30,30]
+# Values are JSON (strings may be given bare), --config run.json holds {name: value} and is applied before the options
+# Unknown names and values of the wrong type (an int for a float default is converted) are errors
+
+# text of an option - JSON, or the bare string
+def parse_value(text,default):
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return text
+    if isinstance(default,str) and not isinstance(value,str) and value is not None: # --model-file 123
+        return text
+    return value
+
+def check_value(name,value,default):
+    if isinstance(default,float) and type(value) is int:
+        return float(value)
+    if isinstance(default,(bool,int,float)) and type(value) is not type(default):
+        raise ValueError(name+' = '+json.dumps(value)+' - expected '+type(default).__name__)
+    return value
+
+# defaults - {name: value} in script order, returns the configuration with every name
+def parse_config(defaults,argv=None,description=None):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--config',default=None,help='JSON file of {name: value} overrides, applied before the options')
+    parser.add_argument('--print-config',action='store_true',help='print the resulting configuration (JSON) and exit')
+    for name, default in defaults.items():
+        flags = ['--'+name.replace('_','-')] + (['--'+name] if '_' in name else [])
+        parser.add_argument(*flags,dest=name,default=argparse.SUPPRESS,metavar='VALUE',
+                            help='default: '+json.dumps(default).replace('%','%%'))
+    args = vars(parser.parse_args(argv))
+
+    config = dict(defaults)
+    try:
+        if args['config'] is not None:
+            with open(args['config']) as f:
+                overrides = json.load(f)
+            for name, value in overrides.items():
+                if name not in defaults:
+                    raise ValueError('unknown name '+name+' in '+args['config'])
+                config[name] = check_value(name,value,defaults[name])
+        for name in defaults:
+            if name in args:
+                config[name] = check_value(name,parse_value(args[name],defaults[name]),defaults[name])
+    except (OSError,ValueError) as error:
+        parser.error(str(error))
+
+    if args['print_config']:
+        json.dump(config,sys.stdout,indent=1)
+        print()
+        sys.exit(0)
+    return config
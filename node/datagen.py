@@ -0,0 +1,73 @@
+import numpy as np
+
+from node.integrators import euler_step
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Generating dynamical system data - many trajectories per call
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Trajectories are written as (num_traj,tsteps,state_len) so that out[j] is a true_state_array for one initial condition.
+# out - optional preallocated (or memory-mapped, see memmap_output) array to write into.
+
+# Preallocated .npy file on disk for large corpora
+def memmap_output(filename,num_traj,tsteps,state_len,dtype='double'):
+    return np.lib.format.open_memmap(filename,mode='w+',dtype=dtype,shape=(num_traj,tsteps,state_len))
+
+def allocate(out,num_traj,tsteps,state_len):
+    if out is None:
+        return np.zeros(shape=(num_traj,tsteps,state_len),dtype='double')
+    if np.shape(out) != (num_traj,tsteps,state_len):
+        raise ValueError('Output array has shape {}, expected {}'.format(np.shape(out),(num_traj,tsteps,state_len)))
+    return out
+
+# Linear system dz/dt = z ds_mat, z rows - closed form z_i = z_0 M^i
+# discretization - 'euler' (M = I + dt ds_mat, the forward Euler data used for training so far) or 'exact' (M = expm(dt ds_mat))
+# Powers M^0..M^(block-1) are precomputed once, every block of time levels is then one batched matmul.
+def linear_trajectories(init_states,ds_mat,tsteps,dt,discretization='euler',out=None,block=256):
+    init_states = np.atleast_2d(init_states)
+    num_traj, state_len = np.shape(init_states)
+    out = allocate(out,num_traj,tsteps,state_len)
+
+    if discretization == 'euler':
+        step_mat = np.eye(state_len) + dt*ds_mat
+    elif discretization == 'exact':
+        from scipy.linalg import expm
+        step_mat = expm(dt*np.asarray(ds_mat))
+    else:
+        raise ValueError('Unknown discretization {} - choose from euler, exact'.format(discretization))
+
+    block = min(block,tsteps)
+    powers = np.zeros(shape=(block,state_len,state_len),dtype='double')
+    powers[0] = np.eye(state_len)
+    for i in range(1,block):
+        powers[i] = np.matmul(powers[i-1],step_mat)
+    block_mat = np.matmul(powers[-1],step_mat) # M^block
+
+    state = np.asarray(init_states,dtype='double')
+    for start in range(0,tsteps,block):
+        num = min(block,tsteps-start)
+        out[:,start:start+num,:] = np.transpose(np.matmul(state,powers[:num]),axes=(1,0,2))
+        state = np.matmul(state,block_mat)
+
+    return out
+
+# RHS of the linear system at every stored state - (num_traj,tsteps,state_len)
+def linear_rhs(states,ds_mat,out=None):
+    if out is None:
+        return np.matmul(states,ds_mat)
+    return np.matmul(states,ds_mat,out=out)
+
+# General (nonlinear) autonomous rhs(z) evaluated on (num_traj,state_len) rows - all trajectories stepped together
+def trajectories(rhs,init_states,tsteps,dt,step=euler_step,out=None):
+    init_states = np.atleast_2d(init_states)
+    num_traj, state_len = np.shape(init_states)
+    out = allocate(out,num_traj,tsteps,state_len)
+
+    state = np.asarray(init_states,dtype='double')
+    out[:,0,:] = state
+    for i in range(1,tsteps):
+        state, _ = step(rhs,state,dt)
+        out[:,i,:] = state
+
+    return out
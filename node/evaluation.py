@@ -0,0 +1,131 @@
+import json
+import hashlib
+import threading
+import numpy as np
+
+from node.inference import rollout
+from node.integrators import euler_step
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Held-out evaluation - error of the rollout from the initial condition over time ranges, per mode, against a baseline
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Unlike the window losses (node.minibatch.window_loss, restarted from the truth every batch_tsteps snapshots) the
+# rollout error includes the drift accumulated over the whole trajectory, which is what forward_model produces.
+# Rollouts are kept per parameter vector (RolloutCache): evaluating the same thetas again - the early stopping best
+# at the end of training, another range, forward_model - reuses the trajectory, and a longer horizon only adds the
+# missing steps from the stored last state (rollout steps carry no state, so the result is bitwise the same)
+# rollout_function(thetas,init_states,num_steps,stats) replaces node.inference.rollout - the scripts pass their rollout
+# entry point, so that rollout_mode and the reduced precision drift guard apply to the evaluation as well
+
+# Per-mode RMSE and RMSE relative to the RMS of true over the time axis - (...,n,state_len) arrays, vectorized over
+# the leading axes and the modes
+def mode_errors(pred,true):
+    true = np.asarray(true,dtype='double')
+    rmse = np.sqrt(np.mean((np.asarray(pred,dtype='double')-true)**2,axis=-2))
+    scale = np.sqrt(np.mean(true**2,axis=-2))
+    return rmse, rmse/np.maximum(scale,np.finfo('double').tiny)
+
+# Time levels of [start,end) ranges as one index array
+def range_indices(ranges):
+    return np.concatenate([np.arange(start,end) for start, end in ranges]).astype(int)
+
+# Trajectories of the max_entries most recently used thetas - read-only (num_traj,tsteps,state_len) arrays
+# Thread safe (the monitor's 'thread' mode rolls out through the same cache as the training loop)
+class RolloutCache:
+    def __init__(self,layout,init_states,dt,step=euler_step,max_entries=4,dtype='double',rollout_function=None):
+        self.layout = layout
+        self.init_states = np.atleast_2d(init_states)
+        self.dt = dt
+        self.step = step
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        self.rollout_function = rollout_function
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'extended': 0, 'misses': 0, 'steps': 0}
+
+    def rollout(self,thetas,init_states,num_steps,out,stats):
+        if self.rollout_function is None:
+            rollout(self.layout.views(np.asarray(thetas,dtype=self.dtype)),init_states,num_steps,self.dt,self.step,out=out,
+                    stats=stats,dtype=self.dtype)
+        else:
+            out[...] = self.rollout_function(thetas,init_states,num_steps,stats)
+
+    def key(self,thetas):
+        return hashlib.sha1(np.ascontiguousarray(thetas,dtype=self.dtype).tobytes()).hexdigest()
+
+    def trajectory(self,thetas,tsteps,stats=None):
+        key = self.key(thetas)
+        with self.lock:
+            cached = self.entries.pop(key,None) # reinserted below as the most recent
+            done = 0 if cached is None else np.shape(cached)[1]
+            if done >= tsteps:
+                self.stats['hits'] = self.stats['hits'] + 1
+                out = cached
+            else:
+                out = np.zeros((np.shape(self.init_states)[0],tsteps,np.shape(self.init_states)[1]),dtype=self.dtype)
+                if cached is None:
+                    self.stats['misses'] = self.stats['misses'] + 1
+                    self.rollout(thetas,self.init_states,tsteps,out,stats)
+                else: # continue from the last stored level
+                    self.stats['extended'] = self.stats['extended'] + 1
+                    out[:,:done,:] = cached
+                    self.rollout(thetas,cached[:,-1,:],tsteps-done+1,out[:,done-1:,:],stats)
+                self.stats['steps'] = self.stats['steps'] + tsteps - max(done,1)
+                out.flags.writeable = False
+            self.store(key,out)
+        return out[:,:tsteps,:]
+
+    # A trajectory of thetas computed elsewhere (e.g. a collective parareal rollout)
+    def put(self,thetas,trajectory):
+        out = np.array(np.reshape(trajectory,(np.shape(self.init_states)[0],-1,np.shape(self.init_states)[1])),dtype=self.dtype)
+        out.flags.writeable = False
+        with self.lock:
+            self.entries.pop(self.key(thetas),None)
+            self.store(self.key(thetas),out)
+
+    def store(self,key,out):
+        self.entries[key] = out
+        while len(self.entries) > self.max_entries:
+            self.entries.pop(next(iter(self.entries)))
+
+# Rollout error of the first trajectory over the time levels of ranges ([start,end) pairs), against true_state_array
+# and, if given, a baseline prediction of the same levels (e.g. the GP coefficients) - rows beyond the baseline are
+# left out of both
+class Evaluator:
+    def __init__(self,cache,true_state_array,ranges,baseline=None):
+        if baseline is not None:
+            ranges = [(start,min(end,len(baseline))) for start, end in ranges]
+        ranges = [(start,end) for start, end in ranges if end > start]
+        if len(ranges) == 0:
+            raise ValueError('no time levels to evaluate')
+        self.cache = cache
+        self.ranges = ranges
+        self.indices = range_indices(ranges)
+        self.horizon = int(self.indices.max()) + 1
+        self.true = np.array(true_state_array[self.indices],dtype='double')
+        self.baseline = None
+        if baseline is not None:
+            self.baseline = mode_errors(baseline[self.indices],self.true)
+
+    # error - mean relative error over the modes (the early stopping quantity), per-mode rmse/relative arrays, and
+    # baseline_rmse/baseline_relative/baseline_error and skill (1 - rmse/baseline_rmse, > 0 where the model is better)
+    def evaluate(self,thetas,stats=None):
+        pred = self.cache.trajectory(thetas,self.horizon,stats)[0]
+        rmse, relative = mode_errors(pred[self.indices],self.true)
+        metrics = {'error': float(np.mean(relative)), 'rmse': rmse, 'relative': relative}
+        if self.baseline is not None:
+            baseline_rmse, baseline_relative = self.baseline
+            metrics.update(baseline_error=float(np.mean(baseline_relative)),baseline_rmse=baseline_rmse,
+                           baseline_relative=baseline_relative,
+                           skill=1.0-rmse/np.maximum(baseline_rmse,np.finfo('double').tiny))
+        return metrics
+
+# JSON file of {name: metrics} (arrays as lists) with the ranges evaluated
+def write_metrics(filename,evaluations):
+    report = {name: dict({key: np.asarray(value).tolist() for key, value in metrics.items()},ranges=ranges)
+              for name, (ranges, metrics) in evaluations.items()}
+    with open(filename,'w') as f:
+        json.dump(report,f,indent=1)
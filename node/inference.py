@@ -0,0 +1,60 @@
+import numpy as np
+
+from node.model import mlp
+from node.integrators import euler_step
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Forward model - rollouts of the trained network for a batch of initial conditions
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# layers - [(W1,b1),...] already in memory (e.g. from theta_reshape), nothing is read from disk
+# init_states - (num_traj,state_len), every row is advanced together - one network evaluation per step and integrator stage
+# Trajectories are (num_traj,tsteps,state_len) with the initial condition at time level 0, as in node.datagen
+# dtype - of the states, pass layers of the same dtype (float32 rollouts: node.precision)
+
+def rhs_function(layers):
+    return lambda state: mlp(state,layers)
+
+def count(stats,nfev):
+    if stats is not None:
+        stats['rollout_nfev'] = stats.get('rollout_nfev',0) + nfev
+
+# Whole trajectories, written into out if given (preallocated or memory-mapped)
+def rollout(layers,init_states,tsteps,dt,step=euler_step,out=None,stats=None,dtype='double'):
+    state = np.array(np.atleast_2d(init_states),dtype=dtype)
+    num_traj, state_len = np.shape(state)
+    if out is None:
+        out = np.zeros(shape=(num_traj,tsteps,state_len),dtype=dtype)
+    rhs = rhs_function(layers)
+
+    out[:,0,:] = state
+    for i in range(1,tsteps):
+        state, nfev = step(rhs,state,dt)
+        out[:,i,:] = state
+        count(stats,nfev)
+
+    return out
+
+# Streaming rollout - yields (start level, (num_traj,n,state_len) chunk) with n <= chunk_size
+# The chunk buffer is reused, copy it if it must outlive the next iteration
+def rollout_chunks(layers,init_states,tsteps,dt,chunk_size=1024,step=euler_step,stats=None,dtype='double'):
+    state = np.array(np.atleast_2d(init_states),dtype=dtype)
+    num_traj, state_len = np.shape(state)
+    buffer = np.zeros(shape=(num_traj,min(chunk_size,tsteps),state_len),dtype=dtype)
+    rhs = rhs_function(layers)
+
+    buffer[:,0,:] = state
+    filled = 1
+    start = 0
+    for i in range(1,tsteps):
+        if filled == chunk_size:
+            yield start, buffer[:,:filled,:]
+            start = start + filled
+            filled = 0
+        state, nfev = step(rhs,state,dt)
+        buffer[:,filled,:] = state
+        filled = filled + 1
+        count(stats,nfev)
+
+    yield start, buffer[:,:filled,:]
@@ -0,0 +1,87 @@
+import numpy as np
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# ODE integrators - Euler Forward, RK4 and adaptive Dormand-Prince 5(4)
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Every integrator has the signature step(rhs,y,h) -> (y_new, nfev)
+# rhs(y) - autonomous right hand side (ffnn has no explicit time dependence), y - array of any shape
+# h - interval to advance over (negative to integrate backward in time), nfev - rhs evaluations used
+
+def euler_step(rhs,y,h):
+    return y + h*rhs(y), 1
+
+def rk4_step(rhs,y,h):
+    k1 = rhs(y)
+    k2 = rhs(y + 0.5*h*k1)
+    k3 = rhs(y + 0.5*h*k2)
+    k4 = rhs(y + h*k3)
+    return y + h/6.0*(k1 + 2.0*k2 + 2.0*k3 + k4), 4
+
+# Dormand-Prince 5(4) tableau
+dp_a = [[],
+        [1.0/5.0],
+        [3.0/40.0, 9.0/40.0],
+        [44.0/45.0, -56.0/15.0, 32.0/9.0],
+        [19372.0/6561.0, -25360.0/2187.0, 64448.0/6561.0, -212.0/729.0],
+        [9017.0/3168.0, -355.0/33.0, 46732.0/5247.0, 49.0/176.0, -5103.0/18656.0],
+        [35.0/384.0, 0.0, 500.0/1113.0, 125.0/192.0, -2187.0/6784.0, 11.0/84.0]]
+dp_b = np.asarray([35.0/384.0, 0.0, 500.0/1113.0, 125.0/192.0, -2187.0/6784.0, 11.0/84.0, 0.0]) # 5th order
+dp_bhat = np.asarray([5179.0/57600.0, 0.0, 7571.0/16695.0, 393.0/640.0, -92097.0/339200.0, 187.0/2100.0, 1.0/40.0]) # 4th order
+dp_e = (dp_b - dp_bhat).tolist() # Python floats - the stages keep the dtype of y (float32 mode)
+
+# One Dormand-Prince step of size h starting from y with k1 = rhs(y) already known (first same as last)
+# Returns the 5th order solution, the embedded error estimate and rhs(y_new) for the next step
+def dopri5_try(rhs,y,h,k1):
+    k = [k1]
+    for i in range(1,7):
+        yi = y + h*sum(a*kj for a, kj in zip(dp_a[i],k))
+        k.append(rhs(yi))
+    # Stage 7 is evaluated at the 5th order solution
+    y_new = yi
+    err = h*sum(e*kj for e, kj in zip(dp_e,k))
+    return y_new, err, k[6]
+
+# Adaptive Dormand-Prince over the interval h - sub-steps under error control until the whole interval is covered
+def dopri5_step(rhs,y,h,rtol=1e-6,atol=1e-8,max_substeps=10000):
+    t = 0.0
+    sub_h = h
+    k1 = rhs(y)
+    nfev = 1
+    num_substeps = 0
+    while abs(t) < abs(h):
+        if num_substeps == max_substeps:
+            raise RuntimeError('dopri5_step did not cover the interval in {} sub-steps'.format(max_substeps))
+        num_substeps = num_substeps + 1
+        sub_h = np.sign(h)*min(abs(sub_h),abs(h)-abs(t))
+
+        y_new, err, k7 = dopri5_try(rhs,y,sub_h,k1)
+        nfev = nfev + 6
+
+        scale = atol + rtol*np.maximum(np.abs(y),np.abs(y_new))
+        err_norm = np.sqrt(np.mean((err/scale)**2))
+
+        if err_norm <= 1.0: # Accept
+            t = t + sub_h
+            y = y_new
+            k1 = k7
+
+        # Standard step size controller with safety factor
+        if err_norm == 0.0:
+            factor = 5.0
+        else:
+            factor = min(5.0,max(0.2,0.9*err_norm**(-0.2)))
+        sub_h = sub_h*factor
+
+    return y, nfev
+
+integrators = {'euler': euler_step, 'rk4': rk4_step, 'dopri5': dopri5_step}
+
+# Integrator by name - the adaptive scheme is bound to its tolerances
+def get_integrator(name,rtol=1e-6,atol=1e-8):
+    if name not in integrators:
+        raise ValueError('Unknown integrator {} - choose from {}'.format(name,list(integrators)))
+    if name == 'dopri5':
+        return lambda rhs, y, h: dopri5_step(rhs,y,h,rtol,atol)
+    return integrators[name]
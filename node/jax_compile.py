@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import pickle
+import hashlib
+import inspect
+import jax
+from jax.experimental import serialize_executable
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Compilation reuse across launches - persistent XLA cache and serialized compiled executables
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# enable_compilation_cache - every jit in the process goes through JAX's on-disk cache (keyed by JAX on the lowered
+# program, so shapes, dtypes and static arguments), a repeat launch skips XLA compilation but still traces
+# compiled - a jitted function of node/jax_node.py lowered and compiled once for the given arguments and stored as a
+# serialized executable - a repeat launch loads it and skips tracing as well
+# Executables are only valid for the JAX version and device they were built on - both are part of the file name - and
+# for the code they were traced from - the file name has a digest of the defining module's source (edits recompile)
+
+default_cache_dir = os.path.join(os.path.expanduser('~'),'.cache','node_jax')
+
+def enable_compilation_cache(cache_dir=default_cache_dir):
+    jax.config.update('jax_compilation_cache_dir',os.path.join(cache_dir,'xla'))
+    jax.config.update('jax_persistent_cache_min_compile_time_secs',0.0) # the small per-function compiles add up
+    return cache_dir
+
+# Shape, dtype (and weak type - Python floats trace differently from arrays) of every traced argument
+def argument_signature(args):
+    return [[list(leaf.shape),str(leaf.dtype),bool(getattr(leaf,'weak_type',False))] if hasattr(leaf,'shape') else [type(leaf).__name__]
+            for leaf in jax.tree_util.tree_leaves(args)]
+
+# sha1 of the source of the module defining jitted_function (node/jax_node.py)
+def code_fingerprint(jitted_function):
+    module = sys.modules[jitted_function.__module__]
+    return hashlib.sha1(inspect.getsource(module).encode()).hexdigest()
+
+def artifact_filename(cache_dir,name,args,static,code=None):
+    device = jax.devices()[0]
+    key = json.dumps({'args':argument_signature(args),'static':sorted(static.items()),'x64':jax.config.jax_enable_x64,'code':code},
+                     default=str)
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir,'executables',name+'_'+jax.__version__+'_'+device.platform+'_'+digest+'.pkl')
+
+def save_executable(filename,executable):
+    payload, in_tree, out_tree = serialize_executable.serialize(executable)
+    os.makedirs(os.path.dirname(filename),exist_ok=True)
+    tmp_filename = filename + '.tmp' + str(os.getpid()) # concurrent jobs of a sweep may compile the same function
+    with open(tmp_filename,'wb') as f:
+        pickle.dump((payload,in_tree,out_tree),f)
+    os.replace(tmp_filename,filename)
+
+def load_executable(filename):
+    with open(filename,'rb') as f:
+        payload, in_tree, out_tree = pickle.load(f)
+    return serialize_executable.deserialize_and_load(payload,in_tree,out_tree)
+
+# Compiled jitted_function for example args (positional, traced) and static (keyword, the function's static_argnames)
+# Call the result with positional arguments of the same shapes and dtypes only, e.g.
+# step = compiled(jax_node.train_step_jit,(thetas,opt_state,key,true_state_array,dt),batch_tsteps=10,...)
+# thetas, opt_state, key, loss = step(thetas,opt_state,key,true_state_array,dt)
+compiled_functions = {}
+
+def compiled(jitted_function,args,cache_dir=default_cache_dir,**static):
+    name = jitted_function.__name__
+    filename = artifact_filename(cache_dir,name,args,static,code_fingerprint(jitted_function))
+    if filename in compiled_functions:
+        return compiled_functions[filename]
+
+    executable = None
+    if os.path.exists(filename):
+        try:
+            executable = load_executable(filename)
+        except Exception:
+            executable = None # stale or unreadable - recompile and overwrite
+    if executable is None:
+        executable = jitted_function.lower(*args,**static).compile()
+        save_executable(filename,executable)
+
+    compiled_functions[filename] = executable
+    return executable
@@ -0,0 +1,196 @@
+import numpy as onp
+import jax.numpy as np
+from jax import grad, jit, jacrev, lax, vmap, vjp, random
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# JAX neural ODE - the algorithm of JIT_GPU/Jax_NODE.ipynb as importable functions
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Same per-window Python loops (unrolled under jit), pvec concatenation and jacrev Jacobians as the notebook, with
+# batch_ids passed in rather than drawn inside the traced function. Enable jax_enable_x64 for double precision.
+# state_len, num_neurons and batch_tsteps are static - changing them recompiles.
+
+def theta_reshape(thetas,state_len,num_neurons):
+    w1_idx_end = num_neurons*state_len
+    b1_idx_end = w1_idx_end + num_neurons
+    w2_idx_end = b1_idx_end + num_neurons*state_len
+
+    weights_1 = np.reshape(thetas[0,0:w1_idx_end],(state_len,num_neurons))
+    bias_1 = np.reshape(thetas[0,w1_idx_end:b1_idx_end],(1,num_neurons))
+    weights_2 = np.reshape(thetas[0,b1_idx_end:w2_idx_end],(num_neurons,state_len))
+    bias_2 = np.reshape(thetas[0,w2_idx_end:],(1,state_len))
+
+    return weights_1, weights_2, bias_1, bias_2
+
+# Simple Feed forward network for RHS calculation
+def ffnn(state,weights_1,weights_2,bias_1,bias_2):
+    h = np.tanh(np.matmul(state,weights_1)+bias_1)
+    return np.matmul(h,weights_2)+bias_2
+
+# Forward model (Neural ODE formulation) - one Euler timestep
+def euler_forward(state,weights_1,weights_2,bias_1,bias_2,dt):
+    i0 = state + dt*ffnn(state,weights_1,weights_2,bias_1,bias_2)
+    f_rhs = ffnn(i0,weights_1,weights_2,bias_1,bias_2)
+    return i0, f_rhs
+
+# Loss as a function of pvec (a concatenated vector of state,thetas,time) - for the adjoint initial condition
+def training_loss(pvec,true_state,state_len,num_neurons,dt):
+    _state = pvec[:,:state_len]
+    _weights_1, _weights_2, _bias_1, _bias_2 = theta_reshape(pvec[:,state_len:-1],state_len,num_neurons)
+    _output_state, _ = euler_forward(_state,_weights_1,_weights_2,_bias_1,_bias_2,dt)
+    return np.sum((_output_state - true_state)**2)
+
+dl_func = grad(training_loss,0)
+
+def rhs_calculator(pvec,state_len,num_neurons):
+    _weights_1, _weights_2, _bias_1, _bias_2 = theta_reshape(pvec[:,state_len:-1],state_len,num_neurons)
+    return ffnn(pvec[:,:state_len],_weights_1,_weights_2,_bias_1,_bias_2).flatten()
+
+df_func = jacrev(rhs_calculator,0) # (state_len,1,state_len+num_wb+1)
+
+# Adjoint RHS - a (1,state_len+num_wb+1) row times the full Jacobian of f
+def adjoint_rhs(a,pvec,state_len,num_neurons):
+    df = np.squeeze(df_func(pvec,state_len,num_neurons),axis=1)
+    return np.matmul(a[:,:state_len],df)
+
+# Neural ODE algorithm - minibatching, one window at a time
+def neural_ode(thetas,true_state_array,batch_ids,dt,batch_tsteps,state_len,num_neurons):
+    weights_1, weights_2, bias_1, bias_2 = theta_reshape(thetas,state_len,num_neurons)
+    num_wb = np.shape(thetas)[1]
+
+    augmented_state = np.zeros(shape=(1,state_len+num_wb+1))
+    total_batch_loss = 0.0
+    for j in range(np.shape(batch_ids)[0]):
+        start_id = batch_ids[j]
+        window = lax.dynamic_slice_in_dim(true_state_array,start_id,batch_tsteps,axis=0)
+
+        # Calculate forward pass - saving states for the reverse sweep
+        batch_states = [window[0:1,:]]
+        for i in range(1,batch_tsteps):
+            output_state, output_rhs = euler_forward(batch_states[-1],weights_1,weights_2,bias_1,bias_2,dt)
+            batch_states.append(output_state)
+
+        # Operations at final time step (setting up initial conditions for the adjoint)
+        time = np.reshape(dt*(start_id+batch_tsteps-2),(1,1)) # prefinal time
+        pvec = np.concatenate((batch_states[-2],thetas,time),axis=1)
+
+        dldz = 2.0*(output_state-window[-1:,:])
+        dl = dl_func(pvec,window[-1:,:],state_len,num_neurons,dt)
+        dldthetas = dl[:,state_len:-1]
+        dldt = np.reshape(np.sum(dldz*output_rhs),(1,1))
+
+        total_batch_loss = total_batch_loss + np.sum((output_state-window[-1:,:])**2)
+
+        # Reverse operation (adjoint evolution in backward time)
+        _augmented_state = np.concatenate((dldz,dldthetas,dldt),axis=1)
+        for i in range(1,batch_tsteps):
+            time = np.reshape(dt*(start_id+batch_tsteps-1-i),(1,1))
+            pvec = np.concatenate((batch_states[-1-i],thetas,time),axis=1)
+            _augmented_state = _augmented_state + dt*adjoint_rhs(_augmented_state,pvec,state_len,num_neurons)
+
+        augmented_state = augmented_state + _augmented_state
+
+    return augmented_state, total_batch_loss
+
+neural_ode_jit = jit(neural_ode,static_argnames=('batch_tsteps','state_len','num_neurons'))
+
+# Forward model - Euler rollout from init_state (1,state_len), (tsteps,state_len) output
+def forward_model(thetas,init_state,dt,tsteps,state_len,num_neurons):
+    weights_1, weights_2, bias_1, bias_2 = theta_reshape(thetas,state_len,num_neurons)
+
+    def euler_scan(state,_):
+        state, _ = euler_forward(state,weights_1,weights_2,bias_1,bias_2,dt)
+        return state, state[0]
+
+    _, pred_state_array = lax.scan(euler_scan,init_state,None,length=tsteps-1)
+    return np.concatenate((init_state,pred_state_array),axis=0)
+
+forward_model_jit = jit(forward_model,static_argnames=('tsteps','state_len','num_neurons'))
+
+# Batch window starts on the host, as in the notebook
+def sample_batch_ids(tsteps,batch_tsteps,num_batches):
+    return onp.random.choice(tsteps-batch_tsteps,num_batches)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Fully jitted training step - lax.scan over time, vmap over windows, jax.random sampling, RMSProp fused in
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Same gradient as neural_ode (Euler forward, Euler adjoint with the Jacobians at the stored states), but the graph
+# holds one copy of the step body instead of num_batches*batch_tsteps unrolled copies, so compile time no longer grows
+# with the window length or count. a.df/dz and a.df/dthetas come from jax.vjp - the Jacobian is never formed.
+# dt, lr and beta are traced - changing them does not recompile
+
+# All windows starting at batch_ids at once - summed augmented adjoint (1,state_len+num_wb+1) and total batch loss
+# The windows are gathered with vmap and stepped as the rows of one (num_batches,state_len) state, so every scan step is
+# a single matmul over all windows and the thetas cotangent comes out already summed over windows
+# (vmapping a per-window gradient instead carries a (num_batches,num_wb) adjoint through the scan - about 2x slower)
+def neural_ode_scan(thetas,true_state_array,batch_ids,dt,batch_tsteps,state_len,num_neurons):
+    windows = vmap(lambda start_id: lax.dynamic_slice_in_dim(true_state_array,start_id,batch_tsteps,axis=0))(batch_ids)
+    rhs = lambda state, _thetas: ffnn(state,*theta_reshape(_thetas,state_len,num_neurons))
+
+    def euler_scan(state,_):
+        state = state + dt*rhs(state,thetas)
+        return state, state
+
+    output_state, states = lax.scan(euler_scan,windows[:,0,:],None,length=batch_tsteps-1)
+    states = np.concatenate((windows[None,:,0,:],states),axis=0) # (batch_tsteps,num_batches,state_len)
+    true_final_state = windows[:,-1,:]
+
+    # Operations at final time step (setting up initial conditions for the adjoint)
+    dldz = 2.0*(output_state-true_final_state)
+    _, last_step_vjp = vjp(lambda _thetas: states[-2] + dt*rhs(states[-2],_thetas),thetas)
+    dldthetas, = last_step_vjp(dldz)
+    dldt = np.reshape(np.sum(dldz*rhs(output_state,thetas)),(1,1))
+
+    # Reverse operation (adjoint evolution in backward time) over levels batch_tsteps-2,...,0
+    def adjoint_scan(carry,state_now):
+        a_z, a_thetas = carry
+        _, rhs_vjp = vjp(rhs,state_now,thetas)
+        a_dfdz, a_dfdthetas = rhs_vjp(a_z)
+        return (a_z + dt*a_dfdz, a_thetas + dt*a_dfdthetas), None
+
+    (a_z, a_thetas), _ = lax.scan(adjoint_scan,(dldz,dldthetas),states[:-1][::-1])
+
+    augmented_state = np.concatenate((np.sum(a_z,axis=0,keepdims=True),a_thetas,dldt),axis=1)
+    return augmented_state, np.sum((output_state-true_final_state)**2)
+
+# Optimizer state of rms_prop_optimize - exp_gradient, lr, lr_counter
+def rms_prop_init(thetas,lr=0.01):
+    return (np.zeros_like(thetas[0]), np.asarray(lr,dtype=thetas.dtype), np.asarray(0))
+
+# One epoch - sample windows from key, gradient, RMSProp update with the scripts' learning rate decay
+# Returns the new thetas, optimizer state, key and the batch loss
+def train_step(thetas,opt_state,key,true_state_array,dt,batch_tsteps,num_batches,state_len,num_neurons,beta=0.9):
+    exp_gradient, lr, lr_counter = opt_state
+    key, subkey = random.split(key)
+    batch_ids = random.randint(subkey,(num_batches,),0,np.shape(true_state_array)[0]-batch_tsteps)
+
+    augmented_state, total_batch_loss = neural_ode_scan(thetas,true_state_array,batch_ids,dt,batch_tsteps,state_len,num_neurons)
+    gradient = augmented_state[0,state_len:-1]
+
+    exp_gradient = beta*exp_gradient + (1.0-beta)*gradient**2 # exp_gradient starts at zero - same as the epoch 0 case
+    thetas = thetas - lr/np.sqrt(exp_gradient)*gradient
+
+    lr_counter = lr_counter + 1
+    decay = lr_counter > 100
+    lr = np.where(decay,lr*0.9,lr)
+    lr_counter = np.where(decay,0,lr_counter)
+
+    return thetas, (exp_gradient,lr,lr_counter), key, total_batch_loss
+
+train_step_jit = jit(train_step,static_argnames=('batch_tsteps','num_batches','state_len','num_neurons'))
+
+# num_epochs steps in one compiled call (lax.scan over epochs) - returns the final state and the (num_epochs,) losses
+def train_epochs(thetas,opt_state,key,true_state_array,dt,num_epochs,batch_tsteps,num_batches,state_len,num_neurons,beta=0.9):
+    def epoch_scan(carry,_):
+        thetas, opt_state, key = carry
+        thetas, opt_state, key, loss = train_step(thetas,opt_state,key,true_state_array,dt,batch_tsteps,num_batches,
+                                                  state_len,num_neurons,beta)
+        return (thetas,opt_state,key), loss
+
+    (thetas, opt_state, key), losses = lax.scan(epoch_scan,(thetas,opt_state,key),None,length=num_epochs)
+    return thetas, opt_state, key, losses
+
+train_epochs_jit = jit(train_epochs,static_argnames=('num_epochs','batch_tsteps','num_batches','state_len','num_neurons'))
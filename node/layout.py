@@ -0,0 +1,67 @@
+import numpy as np
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Parameter layout of an MLP - all weights and biases in one contiguous (1,num_wb) buffer
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# layer_sizes - [state_len, hidden_1, ..., hidden_n, state_len]
+# Buffer order is W1, b1, W2, b2, ... (for one hidden layer the thetas ordering the scripts always used)
+# layers - list of (W (n_in,n_out), b (1,n_out)) pairs, views into the buffer - gradients use the same layout
+
+class ParameterLayout:
+    def __init__(self,layer_sizes):
+        self.layer_sizes = list(layer_sizes)
+        self.slices = []
+        offset = 0
+        for n_in, n_out in zip(self.layer_sizes[:-1],self.layer_sizes[1:]):
+            w_slice = (offset,offset+n_in*n_out,(n_in,n_out))
+            offset = offset + n_in*n_out
+            b_slice = (offset,offset+n_out,(1,n_out))
+            offset = offset + n_out
+            self.slices.append((w_slice,b_slice))
+        self.num_wb = offset
+        self.cached = (None,None) # (buffer, its views) - the reverse sweep keeps writing into the same buffer
+
+    @classmethod
+    def from_layers(cls,layers):
+        layer_sizes = tuple([np.shape(layers[0][0])[0]]+[np.shape(w)[1] for w, _ in layers])
+        if layer_sizes not in layouts:
+            layouts[layer_sizes] = cls(layer_sizes)
+        return layouts[layer_sizes]
+
+    def zeros(self,dtype='double'):
+        return np.zeros(shape=(1,self.num_wb),dtype=dtype)
+
+    # Per-layer views of a (1,num_wb) or (num_wb,) buffer - no copies for a contiguous numpy buffer
+    def views(self,thetas):
+        buffer, views = self.cached
+        if thetas is buffer:
+            return views
+        flat = np.reshape(thetas,(-1,))
+        views = [(np.reshape(flat[w0:w1],w_shape),np.reshape(flat[b0:b1],b_shape))
+                 for (w0,w1,w_shape), (b0,b1,b_shape) in self.slices]
+        self.cached = (thetas,views)
+        return views
+
+    # (1,num_wb) copy of separately held layers
+    def flatten(self,layers):
+        thetas = self.zeros(np.result_type(layers[0][0]))
+        for (w, b), (w_view, b_view) in zip(layers,self.views(thetas)):
+            w_view[:,:] = w
+            b_view[:,:] = b
+        return thetas
+
+    # Xavier initialization - all weights in layer order, then all biases (the random draws of the scripts)
+    # rng - np.random (global seed) or a np.random.RandomState
+    def xavier(self,rng=np.random):
+        sizes = list(zip(self.layer_sizes[:-1],self.layer_sizes[1:]))
+        weights = [rng.randn(n_in,n_out)*np.sqrt(1.0/(n_in+n_out)) for n_in, n_out in sizes]
+        biases = [rng.randn(1,n_out)*np.sqrt(1.0/(n_out)) for _, n_out in sizes]
+        return self.flatten(list(zip(weights,biases)))
+
+layouts = {} # from_layers - one layout per set of layer sizes
+
+# Copy of layers that no longer aliases a training buffer (e.g. to hand to another thread or process)
+def copy_layers(layers):
+    return [(np.array(w),np.array(b)) for w, b in layers]
@@ -0,0 +1,86 @@
+import numpy as np
+
+from node.model import mlp
+from node.adjoint import adjoint_step
+from node.layout import ParameterLayout
+from node.integrators import euler_step
+from node.recompute import forward_window, advance
+from node.profiling import null_timer
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Neural ODE algorithm - all minibatch windows advanced together
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# The windows starting at batch_ids are stacked into one (num_batches,state_len) state and the forward and
+# adjoint sweeps step them in lockstep. With the Euler integrator this is the same algorithm (and result) as the
+# per-window loop in the training scripts. The per-window dL/dthetas are reduced by the matmul contraction over
+# windows inside mlp_vjp.
+# layers - [(W1,b1),...] views from node.layout.ParameterLayout
+# step - integrator from node.integrators, stats - optional dict accumulating rhs evaluations and steps
+# checkpoint_mode, checkpoint_budget - forward state storage for the reverse sweep (see node.recompute)
+# timer - optional node.profiling.PhaseTimer for the forward, loss_gradient and adjoint phases
+# The sweeps run in the dtype of layers (float32 layers - float32 states, adjoints and gradient)
+# Returns the summed augmented state (1,state_len+num_wb+1) and the total batch loss.
+def neural_ode_batched(layers,true_state_array,batch_ids,batch_tsteps,dt,step=euler_step,stats=None,
+                       checkpoint_mode='full',checkpoint_budget=None,timer=null_timer):
+    rhs = lambda state: mlp(state,layers)
+    dtype = layers[0][0].dtype
+
+    # Calculate forward pass - all windows at once, keeping the states the checkpoint mode asks for
+    window_stats = {'nfev': 0}
+    with timer.phase('forward'):
+        output_state, reverse_pairs = forward_window(step,rhs,np.asarray(true_state_array[batch_ids,:],dtype=dtype),batch_tsteps,dt,window_stats,
+                                                     checkpoint_mode,checkpoint_budget)
+    forward_nfev = window_stats['nfev']
+
+    # Operations at final time step (setting up initial conditions for the adjoint)
+    true_final_state = np.asarray(true_state_array[batch_ids+batch_tsteps-1,:],dtype=dtype)
+
+    with timer.phase('loss_gradient'):
+        dldz = 2.0*(output_state-true_final_state) # (num_batches,state_len)
+        dldt = np.sum(dldz*rhs(output_state))
+        dldt = np.reshape(dldt,newshape=(1,1))
+
+    # Find batch loss
+    total_batch_loss = np.sum((output_state-true_final_state)**2)
+
+    # Reverse operation (adjoint evolution in backward time)
+    a_z = dldz
+    a_thetas = ParameterLayout.from_layers(layers).zeros(dtype)
+    a_dthetas = np.zeros_like(a_thetas) # scratch for the per-step increment
+    adjoint_nfev = 0
+    with timer.phase('adjoint'): # includes recomputation of the states not kept by the checkpoint mode
+        for i, (state_now, state_prev) in enumerate(reverse_pairs):
+            if i == 0:
+                # dL/dthetas through the last step - one adjoint step from a_thetas = 0
+                _, a_dthetas, nfev = adjoint_step(step,dldz,state_now,state_prev,layers,dt,out=a_dthetas)
+                a_thetas += a_dthetas
+                adjoint_nfev = adjoint_nfev + nfev
+
+            a_z, a_dthetas, nfev = adjoint_step(step,a_z,state_now,state_prev,layers,dt,out=a_dthetas)
+            a_thetas += a_dthetas
+            adjoint_nfev = adjoint_nfev + nfev
+
+    timer.count('forward_rhs',forward_nfev+1) # +1 - the rhs at the final state for dL/dt
+    timer.count('adjoint_vjp',adjoint_nfev)
+    timer.count('recompute_rhs',window_stats['nfev']-forward_nfev)
+
+    if stats is not None:
+        stats['forward_nfev'] = stats.get('forward_nfev',0) + forward_nfev
+        stats['forward_steps'] = stats.get('forward_steps',0) + batch_tsteps - 1
+        stats['adjoint_nfev'] = stats.get('adjoint_nfev',0) + adjoint_nfev
+        stats['adjoint_steps'] = stats.get('adjoint_steps',0) + batch_tsteps
+        stats['recompute_nfev'] = stats.get('recompute_nfev',0) + window_stats['nfev'] - forward_nfev
+
+    # Reduce over windows
+    augmented_state = np.concatenate((np.sum(a_z,axis=0,keepdims=True),a_thetas,dldt),axis=1)
+
+    return augmented_state, total_batch_loss
+
+# Forward sweep alone - total squared error at the ends of the windows starting at batch_ids (held-out windows)
+def window_loss(layers,true_state_array,batch_ids,batch_tsteps,dt,step=euler_step):
+    rhs = lambda state: mlp(state,layers)
+    dtype = layers[0][0].dtype
+    output_state = advance(step,rhs,np.asarray(true_state_array[batch_ids,:],dtype=dtype),batch_tsteps-1,dt,{'nfev': 0})
+    return np.sum((output_state-np.asarray(true_state_array[batch_ids+batch_tsteps-1,:],dtype=dtype))**2)
@@ -0,0 +1,197 @@
+import time
+import threading
+import queue
+import multiprocessing
+import numpy as np
+
+from node.inference import rollout
+from node.integrators import get_integrator
+from node.layout import copy_layers
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Training visualization - kept off the training thread when requested
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Modes:
+#   'inline'  - rollout and plot in the training loop (blocking plt.pause, the original behaviour)
+#   'process' - a background process owns the figure, does the rollout and redraws - the trainer only hands over weights
+#   'thread'  - a background thread does the rollout and writes the figure to a PNG (no GUI, fine for headless runs)
+#   'off'     - no plotting at all, matplotlib is never imported
+# Snapshots are latest-wins: if the plotter is still busy, an older pending snapshot is replaced, never queued up.
+# min_interval - minimum number of seconds between accepted snapshots (the final state is always drawn)
+# predict - optional predict(thetas) -> (tsteps,num_modes) trajectory, e.g. the training script's forward_model, so that
+# the plotted rollout is the one the script produces (rollout_mode, precision guard). update/close then take the flat
+# thetas instead of layers. It runs in the worker thread or (forked) process
+
+monitor_modes = ['off','inline','thread','process']
+
+# Figure description - plain data so that it can be handed to a background process
+# references - list of (label, times or None for step index, (n,num_modes) values, color or None)
+def plot_spec(init_state,tsteps,dt,integrator='euler',num_modes=2,time_array=None,references=(),ylim=None,figsize=None,
+              filename='Training_Progress.png',loss_filename='Convergence.png'):
+    return {'init_state': np.array(init_state), 'tsteps': tsteps, 'dt': dt, 'integrator': integrator,
+            'num_modes': num_modes, 'time_array': time_array, 'references': list(references), 'ylim': ylim,
+            'figsize': figsize, 'filename': filename, 'loss_filename': loss_filename}
+
+def predict(spec,weights):
+    if spec.get('predict') is not None:
+        return spec['predict'](weights)
+    return rollout(weights,spec['init_state'],spec['tsteps'],spec['dt'],get_integrator(spec['integrator']))[0]
+
+def make_figure(spec,interactive):
+    if interactive:
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots(nrows=spec['num_modes'],ncols=1,figsize=spec['figsize'])
+    else:
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=spec['figsize'])
+        ax = fig.subplots(nrows=spec['num_modes'],ncols=1)
+    ax = np.atleast_1d(ax)
+
+    for i in range(spec['num_modes']):
+        ax[i].set_title('Mode {}'.format(i+1))
+        if spec['ylim'] is not None:
+            ax[i].set_ylim(*spec['ylim'])
+        for label, times, values, color in spec['references']:
+            x = np.arange(np.shape(values)[0]) if times is None else times
+            ax[i].plot(x,values[:,i],label=label,color=color)
+
+    return fig, ax
+
+# Visualization of modal evolution - replaces the previous prediction lines
+def draw_prediction(spec,fig,ax,predicted_states,lines):
+    for ln in lines:
+        ln.remove()
+    x = np.arange(spec['tsteps']) if spec['time_array'] is None else spec['time_array']
+    lines = [ax[i].plot(x,predicted_states[:,i],label='ML',color='orange')[0] for i in range(spec['num_modes'])]
+    ax[-1].legend()
+    fig.tight_layout()
+    return lines
+
+def make_loss_figure(loss_list,interactive):
+    if interactive:
+        import matplotlib.pyplot as plt
+        fig = plt.figure()
+    else:
+        from matplotlib.figure import Figure
+        fig = Figure()
+    ax = fig.add_subplot(1,1,1)
+    ax.set_title('Convergence')
+    ax.semilogy(np.asarray(loss_list))
+    return fig
+
+# Latest-wins handoff to a bounded (maxsize=1) queue
+def offer(snapshots,item):
+    try:
+        snapshots.put_nowait(item)
+    except queue.Full:
+        try:
+            snapshots.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            snapshots.put_nowait(item)
+        except queue.Full:
+            pass
+
+# Background process - owns an interactive figure until the trainer closes the monitor
+def process_worker(snapshots,spec):
+    import matplotlib.pyplot as plt
+    fig, ax = make_figure(spec,True)
+    lines = []
+    while True:
+        item = snapshots.get()
+        if item is None:
+            break
+        kind, payload = item
+        if kind == 'weights':
+            lines = draw_prediction(spec,fig,ax,predict(spec,payload),lines)
+            plt.pause(0.01)
+        elif kind == 'loss':
+            make_loss_figure(payload,True)
+    plt.show()
+
+# Background thread - renders off-screen and writes PNG files
+def thread_worker(snapshots,spec):
+    fig, ax = make_figure(spec,False)
+    lines = []
+    while True:
+        item = snapshots.get()
+        if item is None:
+            break
+        kind, payload = item
+        if kind == 'weights':
+            lines = draw_prediction(spec,fig,ax,predict(spec,payload),lines)
+            fig.savefig(spec['filename'])
+        elif kind == 'loss':
+            make_loss_figure(payload,False).savefig(spec['loss_filename'])
+
+class Monitor:
+    def __init__(self,mode,spec,min_interval=0.0,predict=None):
+        if mode not in monitor_modes:
+            raise ValueError('Unknown monitor mode {} - choose from {}'.format(mode,monitor_modes))
+        self.mode = mode
+        self.spec = dict(spec,predict=predict)
+        spec = self.spec
+        self.min_interval = min_interval
+        self.last_update = -np.inf
+
+        if mode == 'inline':
+            self.fig, self.ax = make_figure(spec,True)
+            self.lines = []
+        elif mode == 'thread':
+            self.snapshots = queue.Queue(maxsize=1)
+            self.worker = threading.Thread(target=thread_worker,args=(self.snapshots,spec),daemon=True)
+            self.worker.start()
+        elif mode == 'process':
+            # fork keeps the training script from being re-executed in the child where it is available
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+            self.snapshots = context.Queue(maxsize=1)
+            self.worker = context.Process(target=process_worker,args=(self.snapshots,spec),daemon=True)
+            self.worker.start()
+
+    def draw_inline(self,weights):
+        import matplotlib.pyplot as plt
+        self.lines = draw_prediction(self.spec,self.fig,self.ax,predict(self.spec,weights),self.lines)
+        plt.pause(0.01)
+        plt.draw()
+
+    # Snapshots are copied - the trainer keeps updating its arrays
+    def copy(self,weights):
+        return np.array(weights) if self.spec['predict'] is not None else copy_layers(weights)
+
+    # New weights (layers [(W1,b1),...], or thetas with predict) - dropped if within min_interval of the last accepted ones
+    def update(self,weights):
+        if self.mode == 'off':
+            return
+        now = time.time()
+        if now - self.last_update < self.min_interval:
+            return
+        self.last_update = now
+
+        weights = self.copy(weights)
+        if self.mode == 'inline':
+            self.draw_inline(weights)
+        else:
+            offer(self.snapshots,('weights',weights))
+
+    # Final prediction (and convergence history) - blocks until the windows are closed in the interactive modes
+    def close(self,weights,loss_list=None):
+        if self.mode == 'off':
+            return
+        weights = self.copy(weights)
+        if self.mode == 'inline':
+            import matplotlib.pyplot as plt
+            self.draw_inline(weights)
+            plt.show()
+            if loss_list is not None:
+                make_loss_figure(loss_list,True)
+                plt.show()
+        else:
+            self.snapshots.put(('weights',weights))
+            if loss_list is not None:
+                self.snapshots.put(('loss',list(loss_list)))
+            self.snapshots.put(None)
+            self.worker.join()
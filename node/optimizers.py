@@ -0,0 +1,183 @@
+import numpy as np
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Optimizers over the flat thetas - RMSProp, Adam, full batch L-BFGS, learning rate schedules and early stopping
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# First order optimizers return the update del_theta for a gradient (thetas = thetas - del_theta), so that the MPI
+# script can keep averaging updates between ranks, and advance their schedule once per call
+# state()/load_state() - plain arrays and scalars for the restart files (node.restart)
+
+# The scripts' schedule - lr*factor once the counter passes every (i.e. after every+1 epochs)
+class StepDecay:
+    def __init__(self,lr,factor=0.9,every=100):
+        self.lr = lr
+        self.factor = factor
+        self.every = every
+        self.counter = 0
+
+    def step(self):
+        self.counter = self.counter + 1
+        if self.counter > self.every:
+            self.lr = self.lr*self.factor
+            self.counter = 0
+
+    def state(self):
+        return {'lr': self.lr, 'lr_counter': self.counter}
+
+    def load_state(self,state):
+        self.lr, self.counter = float(state['lr']), int(state['lr_counter'])
+
+# Cosine annealing from lr to lr_min over num_epochs
+class CosineDecay:
+    def __init__(self,lr,num_epochs,lr_min=0.0):
+        self.lr0 = lr
+        self.lr_min = lr_min
+        self.num_epochs = num_epochs
+        self.epoch = 0
+        self.lr = lr
+
+    def step(self):
+        self.epoch = self.epoch + 1
+        self.lr = self.lr_min + 0.5*(self.lr0-self.lr_min)*(1.0+np.cos(np.pi*min(self.epoch,self.num_epochs)/self.num_epochs))
+
+    def state(self):
+        return {'lr': self.lr, 'lr_counter': self.epoch}
+
+    def load_state(self,state):
+        self.lr, self.epoch = float(state['lr']), int(state['lr_counter'])
+
+class Constant(StepDecay):
+    def __init__(self,lr):
+        StepDecay.__init__(self,lr,factor=1.0,every=np.inf)
+
+schedules = ['step','cosine','constant']
+
+def get_schedule(name,lr,num_epochs):
+    if name == 'step':
+        return StepDecay(lr)
+    if name == 'cosine':
+        return CosineDecay(lr,num_epochs)
+    if name == 'constant':
+        return Constant(lr)
+    raise ValueError('Unknown learning rate schedule {} - choose from {}'.format(name,schedules))
+
+# The original optimizer - exp_gradient starts at zero, so the first update is the scripts' epoch 0 case
+class RMSProp:
+    def __init__(self,schedule,beta=0.9):
+        self.schedule = schedule
+        self.beta = beta
+        self.exp_gradient = None
+
+    def update(self,gradient):
+        if self.exp_gradient is None:
+            self.exp_gradient = np.zeros_like(gradient)
+        self.exp_gradient = self.beta*self.exp_gradient + (1.0-self.beta)*gradient**2
+        del_theta = self.schedule.lr/np.sqrt(self.exp_gradient)*gradient
+        self.schedule.step()
+        return del_theta
+
+    def state(self):
+        return dict(self.schedule.state(),exp_gradient=self.exp_gradient)
+
+    def load_state(self,state):
+        self.schedule.load_state(state)
+        self.exp_gradient = state['exp_gradient']
+
+# Kingma & Ba (2015) with bias correction
+class Adam:
+    def __init__(self,schedule,beta_1=0.9,beta_2=0.999,eps=1e-8):
+        self.schedule = schedule
+        self.beta_1 = beta_1
+        self.beta_2 = beta_2
+        self.eps = eps
+        self.m = None
+        self.v = None
+        self.t = 0
+
+    def update(self,gradient):
+        if self.m is None:
+            self.m, self.v = np.zeros_like(gradient), np.zeros_like(gradient)
+        self.t = self.t + 1
+        self.m = self.beta_1*self.m + (1.0-self.beta_1)*gradient
+        self.v = self.beta_2*self.v + (1.0-self.beta_2)*gradient**2
+        m_hat = self.m/(1.0-self.beta_1**self.t)
+        v_hat = self.v/(1.0-self.beta_2**self.t)
+        del_theta = self.schedule.lr*m_hat/(np.sqrt(v_hat)+self.eps)
+        self.schedule.step()
+        return del_theta
+
+    def state(self):
+        return dict(self.schedule.state(),adam_m=self.m,adam_v=self.v,adam_t=self.t)
+
+    def load_state(self,state):
+        self.schedule.load_state(state)
+        self.m, self.v, self.t = state['adam_m'], state['adam_v'], int(state['adam_t'])
+
+optimizers = {'rmsprop': RMSProp, 'adam': Adam}
+
+def get_optimizer(name,schedule):
+    if name not in optimizers:
+        raise ValueError('Unknown optimizer {} - choose from {} (or lbfgs)'.format(name,list(optimizers)))
+    return optimizers[name](schedule)
+
+# Stops when the held-out loss has not improved by min_delta (relative) in patience checks - keeps the best thetas
+class EarlyStopping:
+    def __init__(self,patience,min_delta=0.0):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best_loss = np.inf
+        self.best_thetas = None
+        self.best_epoch = -1
+        self.num_bad = 0
+
+    # True when training should stop
+    def update(self,epoch,loss,thetas):
+        if loss < self.best_loss*(1.0-self.min_delta):
+            self.best_loss, self.best_thetas, self.best_epoch = loss, np.array(thetas), epoch
+            self.num_bad = 0
+        else:
+            self.num_bad = self.num_bad + 1
+        return self.patience > 0 and self.num_bad >= self.patience
+
+    # Empty until the first check
+    def state(self):
+        if self.best_thetas is None:
+            return {}
+        return {'val_best_loss': self.best_loss, 'val_best_thetas': self.best_thetas, 'val_best_epoch': self.best_epoch,
+                'val_num_bad': self.num_bad}
+
+    def load_state(self,state):
+        if 'val_best_thetas' in state:
+            self.best_loss, self.best_thetas = float(state['val_best_loss']), state['val_best_thetas']
+            self.best_epoch, self.num_bad = int(state['val_best_epoch']), int(state['val_num_bad'])
+
+# Full batch L-BFGS (scipy L-BFGS-B) - loss_and_gradient(thetas) -> (loss, (num_wb,) gradient) over a fixed set of
+# windows, so every line search sees the same deterministic objective (use the exact backprop gradient)
+# callback(iteration,thetas) - after every iteration, returning True stops the minimization at that iterate
+# Returns the thetas (shape and dtype of the input) and scipy's result (None if stopped by the callback)
+def lbfgs(loss_and_gradient,thetas,maxiter=200,callback=None,gtol=1e-10):
+    from scipy.optimize import minimize # imported here - scipy.optimize adds about half a second to every start
+    shape, dtype = np.shape(thetas), thetas.dtype
+    progress = {'iteration': 0, 'x': np.asarray(thetas,dtype='double').flatten()}
+
+    def fun(x):
+        loss, gradient = loss_and_gradient(np.reshape(x,shape).astype(dtype))
+        return float(loss), np.asarray(gradient,dtype='double').flatten()
+
+    def iteration_callback(x):
+        progress['x'] = np.array(x)
+        stop = callback is not None and callback(progress['iteration'],np.reshape(x,shape).astype(dtype))
+        progress['iteration'] = progress['iteration'] + 1
+        if stop:
+            raise StopIteration
+
+    try:
+        result = minimize(fun,progress['x'],jac=True,method='L-BFGS-B',callback=iteration_callback,
+                          options={'maxiter': maxiter,'gtol': gtol})
+        if result.status == 99: # newer scipy ends the minimization itself on StopIteration
+            result = None
+    except StopIteration:
+        result = None
+    return np.reshape(progress['x'],shape).astype(dtype), result
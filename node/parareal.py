@@ -0,0 +1,116 @@
+import numpy as np
+
+from node.inference import rollout, rhs_function
+from node.integrators import euler_step, rk4_step
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Parallel in time rollouts - parareal (Lions, Maday & Turinici 2001) over time slices of the trajectory
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# The tsteps-1 fine steps are cut into num_slices slices. A coarse propagator G (coarse_step with one step per
+# coarse_factor fine steps) predicts the slice start states sequentially, the fine propagator F (the rollout's own
+# integrator) runs every slice from its predicted start in parallel, and the starts are corrected sequentially
+#     U_{k+1} <- G(U_k new) + F(U_k old) - G(U_k old)
+# until they change by less than tolerance (relative to the largest state). After i iterations the first i slices
+# are exact, slices whose start is unchanged reuse their fine sweep - with fast convergence the wall time is a few
+# slices of fine steps instead of all of them.
+# Parallel fine sweeps on comm (MPI or node.pool ranks - slice k on rank k % nprocs, collective) or pool (any
+# object with starmap, e.g. a multiprocessing Pool), serially otherwise
+
+# Slice boundaries - time levels bounds[k] to bounds[k+1]
+def slice_bounds(tsteps,num_slices):
+    num_slices = max(1,min(num_slices,tsteps-1))
+    return [(k*(tsteps-1))//num_slices for k in range(num_slices+1)]
+
+# F - (num_traj,num_steps+1,state_len) trajectory of one slice (module level so that process pools can pickle it)
+def fine_slice(layers,state,num_steps,dt,step=euler_step,dtype='double'):
+    return rollout(layers,state,num_steps+1,dt,step,dtype=dtype)
+
+# G - over num_steps fine steps with ceil(num_steps/coarse_factor) steps of coarse_step
+def coarse_slice(rhs,state,num_steps,dt,coarse_step=rk4_step,coarse_factor=10,stats=None):
+    num_coarse = max(1,-(-num_steps//coarse_factor))
+    h = num_steps*dt/num_coarse
+    for _ in range(num_coarse):
+        state, nfev = coarse_step(rhs,state,h)
+        if stats is not None:
+            stats['coarse_nfev'] = stats.get('coarse_nfev',0) + nfev
+    return state
+
+# Same arguments and result as node.inference.rollout - (num_traj,tsteps,state_len) trajectories
+# stats - fine_steps (of this process), coarse_nfev, parareal_iterations and parareal_change (last relative change)
+def parareal(layers,init_states,tsteps,dt,num_slices=16,step=euler_step,coarse_step=rk4_step,coarse_factor=10,
+             tolerance=1e-8,max_iterations=None,comm=None,pool=None,stats=None,dtype='double'):
+    state = np.array(np.atleast_2d(init_states),dtype=dtype)
+    num_traj, state_len = np.shape(state)
+    bounds = slice_bounds(tsteps,num_slices)
+    num_slices = len(bounds) - 1
+    slice_steps = np.diff(bounds)
+    rank, nprocs = (0,1) if comm is None else (comm.Get_rank(),comm.Get_size())
+    owned = [k for k in range(num_slices) if k % nprocs == rank]
+    rhs = rhs_function(layers)
+    if max_iterations is None:
+        max_iterations = num_slices # exact after num_slices iterations
+
+    # Coarse prediction
+    starts = np.zeros((num_slices+1,num_traj,state_len),dtype=dtype)
+    starts[0] = state
+    coarse = np.zeros((num_slices,num_traj,state_len),dtype=dtype) # G(starts[k])
+    for k in range(num_slices):
+        coarse[k] = coarse_slice(rhs,starts[k],slice_steps[k],dt,coarse_step,coarse_factor,stats)
+        starts[k+1] = coarse[k]
+
+    fine = np.zeros((num_slices,num_traj,state_len),dtype=dtype) # F(fine_starts[k])
+    fine_starts = np.full((num_slices,num_traj,state_len),np.nan,dtype=dtype)
+    trajectories = {}
+    scale = max(float(np.max(np.abs(starts))),np.finfo('double').tiny)
+    change = np.inf
+    for iteration in range(1,max_iterations+1):
+        # Fine sweeps of the slices whose start moved
+        todo = [k for k in owned if not np.array_equal(starts[k],fine_starts[k])]
+        if pool is not None:
+            results = pool.starmap(fine_slice,[(layers,starts[k],slice_steps[k],dt,step,dtype) for k in todo])
+        else:
+            results = [fine_slice(layers,starts[k],slice_steps[k],dt,step,dtype) for k in todo]
+        for k, trajectory in zip(todo,results):
+            trajectories[k] = trajectory
+            fine_starts[k] = starts[k]
+        if stats is not None:
+            stats['fine_steps'] = stats.get('fine_steps',0) + int(sum(slice_steps[k] for k in todo))
+
+        for k in owned:
+            fine[k] = trajectories[k][:,-1,:]
+        if comm is not None: # every slice's end state on every rank - one owner per row, the others add zeros
+            send = np.zeros(np.shape(fine),dtype='double')
+            send[owned] = fine[owned]
+            received = np.zeros_like(send)
+            comm.Allreduce(send,received)
+            fine[...] = received
+
+        # Sequential correction
+        previous = np.array(starts)
+        for k in range(num_slices):
+            if not np.array_equal(starts[k],previous[k]): # G(U_k) is unchanged for converged starts
+                coarse_new = coarse_slice(rhs,starts[k],slice_steps[k],dt,coarse_step,coarse_factor,stats)
+                starts[k+1] = coarse_new + fine[k] - coarse[k]
+                coarse[k] = coarse_new
+            else:
+                starts[k+1] = coarse[k] + fine[k] - coarse[k]
+        change = float(np.max(np.abs(starts-previous)))
+        if change <= tolerance*scale:
+            break
+
+    # Assembled from the last fine sweeps - rows [bounds[k],bounds[k+1]) of slice k and the final level of the last
+    out = np.zeros((num_traj,tsteps,state_len),dtype=dtype)
+    for k in owned:
+        end = bounds[k+1] + (1 if k == num_slices-1 else 0)
+        out[:,bounds[k]:end,:] = trajectories[k][:,:end-bounds[k],:]
+    if comm is not None:
+        gathered = np.zeros_like(out,dtype='double')
+        comm.Allreduce(np.asarray(out,dtype='double'),gathered)
+        out = gathered.astype(dtype)
+
+    if stats is not None:
+        stats['parareal_iterations'] = stats.get('parareal_iterations',0) + iteration
+        stats['parareal_change'] = change/scale
+    return out
@@ -0,0 +1,176 @@
+import os
+import sys
+import mmap
+import atexit
+import pickle
+import multiprocessing
+import numpy as np
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Single node data parallel training without MPI - forked local ranks and shared memory collectives
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# spawn_ranks(nprocs) forks nprocs-1 copies of the running script and returns a communicator in every process, so the
+# rest of the script runs SPMD exactly as under mpiexec (rank 0 is the original process)
+# PoolComm has the subset of the mpi4py communicator used by node.comm, node.shards and node.restart - Bcast, Allreduce
+# and Iallreduce (sum) work on numpy buffers through one anonymous shared mapping with a row per rank: every rank
+# writes its row, waits at the barrier and reads the others' rows, nothing is pickled or sent through pipes
+# Iallreduce stages its contribution in a separate slot of the mapping (one per request in flight, as many as slots in
+# spawn_ranks), so blocking collectives between it and Wait() do not overwrite it
+# Sums are taken in rank order, so every rank gets bitwise identical results
+# POSIX only (os.fork)
+
+class PoolRequest:
+    def __init__(self,comm,slot,count,recvbuf):
+        self.comm = comm
+        self.slot = slot
+        self.count = count
+        self.recvbuf = recvbuf
+
+    def Wait(self):
+        if self.slot is not None:
+            self.comm.reduce_rows(self.count,self.recvbuf,self.comm.staging[self.slot])
+            self.comm.pending[self.slot] = False
+            self.slot = None
+
+class PoolComm:
+    def __init__(self,rank,nprocs,barrier,rows,staging,children=()):
+        self.rank = rank
+        self.nprocs = nprocs
+        self.barrier = barrier
+        self.rows = rows # (nprocs,capacity) doubles in shared memory
+        self.staging = staging # (slots,nprocs,capacity) - contributions of the requests in flight
+        self.pending = [False]*len(staging) # every rank starts and waits for requests in the same order
+        self.children = list(children)
+
+    def Get_rank(self):
+        return self.rank
+
+    def Get_size(self):
+        return self.nprocs
+
+    def Barrier(self):
+        self.barrier.wait()
+
+    def row(self,count):
+        if count > self.rows.shape[1]:
+            raise ValueError('Message of '+str(count)+' doubles exceeds the pool buffer ('+str(self.rows.shape[1])+') - raise capacity in spawn_ranks')
+        return self.rows[self.rank,:count]
+
+    def Bcast(self,buf,root=0):
+        buf = np.asarray(buf).reshape(-1)
+        if self.rank == root:
+            self.row(buf.size)[:] = buf
+        self.barrier.wait()
+        if self.rank != root:
+            buf[:] = self.rows[root,:buf.size]
+        self.barrier.wait() # root's row is free again
+
+    def reduce_rows(self,count,recvbuf,rows=None):
+        rows = self.rows if rows is None else rows
+        self.barrier.wait()
+        np.asarray(recvbuf).reshape(-1)[:] = np.sum(rows[:,:count],axis=0)
+        self.barrier.wait() # the rows are free again
+
+    def Allreduce(self,sendbuf,recvbuf):
+        sendbuf = np.asarray(sendbuf).reshape(-1)
+        self.row(sendbuf.size)[:] = sendbuf
+        self.reduce_rows(sendbuf.size,recvbuf)
+
+    # The send buffer is copied into a free staging slot right away, the exchange itself happens in Wait()
+    def Iallreduce(self,sendbuf,recvbuf):
+        sendbuf = np.asarray(sendbuf).reshape(-1)
+        self.row(sendbuf.size) # size check
+        if all(self.pending):
+            raise RuntimeError('More than '+str(len(self.pending))+' Iallreduce requests in flight - raise slots in spawn_ranks')
+        slot = self.pending.index(False)
+        self.pending[slot] = True
+        self.staging[slot,self.rank,:sendbuf.size] = sendbuf
+        return PoolRequest(self,slot,sendbuf.size,recvbuf)
+
+    # Small Python objects (restart iterations) - pickled into the byte view of each row
+    def allgather(self,obj):
+        data = pickle.dumps(obj)
+        row = self.row(1+(len(data)+7)//8).view(np.uint8)
+        row[:8] = np.frombuffer(np.int64(len(data)).tobytes(),dtype=np.uint8)
+        row[8:8+len(data)] = np.frombuffer(data,dtype=np.uint8)
+        self.barrier.wait()
+        objs = []
+        for rank in range(self.nprocs):
+            other = self.rows[rank].view(np.uint8)
+            length = int(other[:8].view(np.int64)[0])
+            objs.append(pickle.loads(other[8:8+length].tobytes()))
+        self.barrier.wait()
+        return objs
+
+    # Rank 0 - wait for the other ranks at exit and pass on a failure
+    def join(self):
+        status = 0
+        for pid in self.children:
+            _, child_status = os.waitpid(pid,0)
+            status = status or os.waitstatus_to_exitcode(child_status)
+        self.children = []
+        if status != 0:
+            sys.stderr.write('Pool rank exited with status '+str(status)+'\n')
+            os._exit(status)
+
+# capacity - doubles per rank in the shared buffer (largest collective, e.g. num_wb+1), pages are only touched as used
+# slots - Iallreduce requests that may be in flight at once
+def spawn_ranks(nprocs,capacity=1<<20,slots=2):
+    shared = mmap.mmap(-1,(1+slots)*nprocs*capacity*8) # anonymous MAP_SHARED - inherited by the forked ranks
+    buffers = np.frombuffer(shared,dtype='double').reshape(1+slots,nprocs,capacity)
+    rows, staging = buffers[0], buffers[1:]
+    barrier = multiprocessing.Barrier(nprocs)
+
+    # A rank that dies breaks the barrier, so the others raise BrokenBarrierError instead of waiting forever
+    def abort_excepthook(exc_type,exc_value,exc_traceback):
+        barrier.abort()
+        sys.__excepthook__(exc_type,exc_value,exc_traceback)
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    children = []
+    for rank in range(1,nprocs):
+        pid = os.fork()
+        if pid == 0:
+            sys.excepthook = abort_excepthook
+            return PoolComm(rank,nprocs,barrier,rows,staging)
+        children.append(pid)
+
+    sys.excepthook = abort_excepthook
+    comm = PoolComm(0,nprocs,barrier,rows,staging,children)
+    atexit.register(comm.join)
+    return comm
+
+# 'python -m node.pool' - collectives of 3 ranks against their expected sums, including blocking collectives while an
+# Iallreduce is in flight (as GradientSync overlap with the validation Bcast of NODE_MPI.py)
+def check(nprocs=3):
+    comm = spawn_ranks(nprocs)
+    rank = comm.Get_rank()
+    ranks = np.arange(nprocs)
+    expected = np.array([nprocs,10.0*np.sum(ranks+1),100.0*nprocs])
+
+    send = np.array([1.0,10.0*(rank+1),100.0])
+    received = np.zeros(3)
+    request = comm.Iallreduce(send,received)
+    flag = np.array([7.0 if rank == 0 else 0.0])
+    comm.Bcast(flag,root=0)
+    total = np.zeros(1)
+    comm.Allreduce(np.ones(1),total)
+    send[:] = -1.0 # the contribution was staged at the start
+    request.Wait()
+    assert np.array_equal(received,expected), (rank,received,expected)
+    assert flag[0] == 7.0 and total[0] == nprocs, (rank,flag,total)
+
+    first, second = np.zeros(1), np.zeros(1)
+    requests = [comm.Iallreduce(np.ones(1),first),comm.Iallreduce(np.full(1,2.0),second)]
+    for request in requests:
+        request.Wait()
+    assert first[0] == nprocs and second[0] == 2.0*nprocs, (rank,first,second)
+    if rank == 0:
+        print('PoolComm collectives - ok')
+    return comm
+
+if __name__ == '__main__':
+    check()
@@ -0,0 +1,51 @@
+import numpy as np
+
+from node.inference import rollout
+from node.integrators import euler_step
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Reduced precision - float32 sweeps and rollouts, float64 master parameters and a drift check
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# node.minibatch, node.adjoint and node.inference run in the dtype of the layers they are given, so float32 training
+# only needs float32 parameters - either thetas itself (optimizer in float32) or a working copy of float64 master
+# thetas refreshed every epoch (optimizer updates accumulate in float64)
+
+precisions = {'double': np.float64, 'single': np.float32}
+
+def get_dtype(precision):
+    if precision not in precisions:
+        raise ValueError('Unknown precision {} - choose from {}'.format(precision,list(precisions)))
+    return np.dtype(precisions[precision])
+
+# thetas in dtype - thetas itself if it already is, otherwise copied into the same buffer on every call so that
+# ParameterLayout.views keeps returning its cached views
+class WorkingCopy:
+    def __init__(self,dtype):
+        self.dtype = np.dtype(dtype)
+        self.buffer = None
+
+    def __call__(self,thetas):
+        if thetas.dtype == self.dtype:
+            return thetas
+        if self.buffer is None or self.buffer.shape != np.shape(thetas):
+            self.buffer = np.empty(np.shape(thetas),dtype=self.dtype)
+        self.buffer[...] = thetas
+        return self.buffer
+
+# Rollout in dtype against the float64 rollout of the same parameters and initial states
+# Returns both (num_traj,tsteps,state_len) trajectories and the drift - max_abs error, relative (max_abs over the
+# largest reference magnitude) and drift_step, the first time level where the relative error exceeds tolerance
+# rollout_function - node.inference.rollout or one with its arguments (e.g. parareal over a pool or communicator)
+def rollout_drift(layout,thetas,init_states,tsteps,dt,step=euler_step,dtype=np.float32,tolerance=1e-3,stats=None,
+                  rollout_function=rollout):
+    reference = rollout_function(layout.views(np.asarray(thetas,dtype='double')),init_states,tsteps,dt,step)
+    reduced = rollout_function(layout.views(np.asarray(thetas,dtype=dtype)),init_states,tsteps,dt,step,stats=stats,dtype=dtype)
+
+    error = np.max(np.abs(reduced-reference),axis=(0,2)) # per time level
+    scale = max(np.max(np.abs(reference)),np.finfo('double').tiny)
+    exceeded = np.nonzero(error > tolerance*scale)[0]
+    drift = {'max_abs': float(np.max(error)), 'relative': float(np.max(error)/scale),
+             'drift_step': int(exceeded[0]) if len(exceeded) > 0 else None}
+    return reduced, reference, drift
@@ -0,0 +1,93 @@
+import os
+import json
+import mmap
+import numpy as np
+
+from node.model import mlp
+from node.layout import ParameterLayout
+from node.inference import rollout
+from node.integrators import get_integrator
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Standalone inference artifact - one file with the model description and memory-mappable weights, and its predictor
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# File layout: magic (8 bytes), header length (uint64 little endian), JSON header padded to a multiple of 64 bytes,
+# then the flat (num_wb,) thetas in the layout of node.layout (little endian float64 or float32)
+# The header holds layer_sizes, activation, dt, integrator (with rtol/atol), dtype, num_wb and any extra metadata
+# Imports NumPy and the NumPy-only node.model/node.layout/node.inference/node.integrators - no autograd, scipy, matplotlib or
+# training script is needed to load and run a model
+
+magic = b'NODEART1'
+alignment = 64
+format_version = 1
+
+# Writes thetas (any shape with num_wb entries) - metadata is added to the header (JSON types only)
+def export_model(filename,thetas,layer_sizes,dt,integrator='euler',dtype=None,rtol=1e-6,atol=1e-8,metadata=None):
+    layout = ParameterLayout(layer_sizes)
+    dtype = np.dtype(dtype if dtype is not None else np.asarray(thetas).dtype).newbyteorder('<')
+    data = np.ascontiguousarray(np.reshape(thetas,(-1,)),dtype=dtype)
+    if data.size != layout.num_wb:
+        raise ValueError('thetas has '+str(data.size)+' entries, layer sizes '+str(list(layer_sizes))+' need '+str(layout.num_wb))
+
+    header = {'format_version': format_version, 'layer_sizes': [int(n) for n in layer_sizes], 'activation': 'tanh',
+              'dt': float(dt), 'integrator': integrator, 'rtol': float(rtol), 'atol': float(atol),
+              'dtype': dtype.str, 'num_wb': layout.num_wb, 'metadata': metadata or {}}
+    text = json.dumps(header).encode('utf-8')
+    text = text + b' '*(-(len(magic)+8+len(text)) % alignment)
+
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename,'wb') as f:
+        f.write(magic)
+        f.write(np.uint64(len(text)).astype('<u8').tobytes())
+        f.write(text)
+        f.write(data.tobytes())
+    os.replace(tmp_filename,filename)
+
+class Predictor:
+    def __init__(self,header,thetas,mapping=None):
+        self.header = header
+        self.metadata = header['metadata']
+        self.layer_sizes = header['layer_sizes']
+        self.state_len = self.layer_sizes[0]
+        self.dt = header['dt']
+        self.dtype = thetas.dtype
+        self.step = get_integrator(header['integrator'],header['rtol'],header['atol'])
+        self.thetas = thetas
+        self.layers = ParameterLayout(self.layer_sizes).views(thetas)
+        self.mapping = mapping
+
+    # Weights are views of a read-only map of the file - nothing is copied, pages are read on first use
+    @classmethod
+    def load(cls,filename):
+        with open(filename,'rb') as f:
+            mapping = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        if mapping[:len(magic)] != magic:
+            mapping.close()
+            raise ValueError(filename+' is not a model artifact (see node.predictor.export_model)')
+        header_len = int(np.frombuffer(mapping,dtype='<u8',count=1,offset=len(magic))[0])
+        offset = len(magic) + 8
+        header = json.loads(bytes(mapping[offset:offset+header_len]).decode('utf-8'))
+        if header['format_version'] > format_version:
+            raise ValueError(filename+' has format version '+str(header['format_version'])+', this predictor reads '+str(format_version))
+        thetas = np.frombuffer(mapping,dtype=np.dtype(header['dtype']),count=header['num_wb'],offset=offset+header_len)
+        return cls(header,thetas,mapping)
+
+    # f(z) for (num_traj,state_len) states
+    def rhs(self,states):
+        return mlp(np.asarray(states,dtype=self.dtype),self.layers)
+
+    # (num_traj,tsteps,state_len) trajectories from (num_traj,state_len) initial states, written into out if given
+    def rollout(self,init_states,tsteps,out=None,stats=None):
+        return rollout(self.layers,init_states,tsteps,self.dt,self.step,out=out,stats=stats,dtype=self.dtype)
+
+    def close(self):
+        self.layers = None
+        self.thetas = None
+        if self.mapping is not None:
+            try:
+                self.mapping.close()
+            except BufferError: # arrays from this predictor are still referenced - the map closes with them
+                pass
+            self.mapping = None
@@ -0,0 +1,72 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Per-phase timings and evaluation counters of the training loop - one JSON line per epoch
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Phases used by the scripts (seconds): forward, loss_gradient, adjoint, optimizer, save, plot, data (waiting for streamed
+# windows) and, with MPI, wait (for other ranks to reach the exchange) and communication
+# Counters: forward_rhs, adjoint_vjp, recompute_rhs (batched mode - one count per call on all stacked windows),
+# jacobian and loss_gradient (loop mode - per window) evaluations
+# A disabled timer hands out a shared null context, so the hooks cost next to nothing in normal runs
+
+class PhaseTimer:
+    def __init__(self,filename=None,enabled=True,**fields):
+        self.enabled = enabled
+        self.fields = fields # written into every record, e.g. rank
+        self.file = open(filename,'w') if (enabled and filename is not None) else None
+        self.null_phase = nullcontext()
+        self.totals = {}
+        self.num_epochs = 0
+        self.reset()
+
+    def reset(self):
+        self.phases = {}
+        self.counts = {}
+        self.epoch_start = time.perf_counter()
+
+    @contextmanager
+    def timed(self,name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name,0.0) + time.perf_counter() - start
+
+    def phase(self,name):
+        return self.timed(name) if self.enabled else self.null_phase
+
+    def count(self,name,n=1):
+        if self.enabled:
+            self.counts[name] = self.counts.get(name,0) + n
+
+    # Closes the epoch's record - extra fields (loss, ...) are added as given
+    def end_epoch(self,epoch,**fields):
+        if not self.enabled:
+            return None
+        record = dict(self.fields,epoch=epoch,epoch_s=time.perf_counter()-self.epoch_start)
+        record.update({name+'_s': seconds for name, seconds in self.phases.items()})
+        record.update(self.counts)
+        record.update({name: (value.item() if hasattr(value,'item') else value) for name, value in fields.items()}) # numpy scalars for json
+        for name, value in record.items():
+            if name.endswith('_s') or name in self.counts:
+                self.totals[name] = self.totals.get(name,0) + value
+        self.num_epochs = self.num_epochs + 1
+        if self.file is not None:
+            self.file.write(json.dumps(record)+'\n')
+        self.reset()
+        return record
+
+    # Mean per epoch of every phase and counter
+    def summary(self):
+        return {name: total/max(self.num_epochs,1) for name, total in self.totals.items()}
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+null_timer = PhaseTimer(enabled=False)
@@ -0,0 +1,92 @@
+import numpy as np
+from math import comb
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Checkpointed forward states for the adjoint sweep
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# The reverse sweep visits the time levels of a window backward and needs the pair (z_k, z_k-1) at every step.
+# Modes:
+#   'full'    - every forward state is stored (memory ~ batch_tsteps states)
+#   'stride'  - every stride-th state is stored, one segment at a time is recomputed during the reverse sweep
+#               (memory ~ budget checkpoints + one segment, one extra forward pass)
+#   'revolve' - binomial checkpointing (Griewank & Walther) with budget checkpoints - minimal recomputation
+#               for the given memory, suited to windows of thousands of steps
+# forward_window returns the final state and a generator of (z_k, z_k-1) for k = batch_tsteps-1,...,1
+
+checkpoint_modes = ['full','stride','revolve']
+
+def advance(step,rhs,state,num_steps,dt,stats):
+    for _ in range(num_steps):
+        state, nfev = step(rhs,state,dt)
+        stats['nfev'] = stats['nfev'] + nfev
+    return state
+
+# Stored levels are 0, stride, 2*stride, ... and the final level
+def stride_pairs(step,rhs,checkpoints,stride,final_level,dt,stats):
+    for start in reversed(range(0,final_level,stride)):
+        end = min(start+stride,final_level)
+        # Recompute the segment from its checkpoint (stored levels are reused)
+        segment = [checkpoints[start]]
+        for level in range(start+1,end+1):
+            if level in checkpoints:
+                segment.append(checkpoints[level])
+            else:
+                segment.append(advance(step,rhs,segment[-1],1,dt,stats))
+        for level in range(end,start,-1):
+            yield segment[level-start], segment[level-start-1]
+
+# Position of the next checkpoint for num_steps remaining steps and budget checkpoints (including the start state)
+# beta(s,t) = comb(s+t,s) steps are reversible with s checkpoints and at most t recomputations of any step
+def binomial_split(num_steps,budget):
+    t = 1
+    while comb(budget+t,budget) < num_steps:
+        t = t + 1
+    return max(1,min(comb(budget+t-1,budget),num_steps-comb(budget-1+t,budget-1)))
+
+# Reverse from level end to level start, state at start known - recursion depth is bounded by the budget
+def revolve_pairs(step,rhs,state_start,start,end,budget,dt,stats):
+    while end > start:
+        num_steps = end - start
+        if num_steps == 1:
+            yield advance(step,rhs,state_start,1,dt,stats), state_start
+            return
+        if budget == 1: # Only the start state - recompute from it for every step
+            for level in range(end-1,start-1,-1):
+                state_prev = advance(step,rhs,state_start,level-start,dt,stats)
+                yield advance(step,rhs,state_prev,1,dt,stats), state_prev
+            return
+
+        split = binomial_split(num_steps,budget)
+        state_split = advance(step,rhs,state_start,split,dt,stats)
+        yield from revolve_pairs(step,rhs,state_split,start+split,end,budget-1,dt,stats)
+        end = start + split
+
+# Forward sweep over a window starting from state (rows,state_len) with batch_tsteps time levels
+# stats - dict, forward and recomputation rhs evaluations are accumulated into stats['nfev']
+def forward_window(step,rhs,state,batch_tsteps,dt,stats,mode='full',budget=None):
+    if mode not in checkpoint_modes:
+        raise ValueError('Unknown checkpoint mode {} - choose from {}'.format(mode,checkpoint_modes))
+    final_level = batch_tsteps - 1
+
+    if mode == 'revolve':
+        if budget is None:
+            raise ValueError('revolve checkpointing needs a checkpoint budget')
+        final_state = advance(step,rhs,state,final_level,dt,stats)
+        return final_state, revolve_pairs(step,rhs,state,0,final_level,max(budget,1),dt,stats)
+
+    if mode == 'full':
+        stride = 1
+    else:
+        if budget is None:
+            raise ValueError('stride checkpointing needs a checkpoint budget')
+        stride = max(1,int(np.ceil(final_level/max(budget-1,1))))
+
+    checkpoints = {0: state}
+    for level in range(1,batch_tsteps):
+        state = advance(step,rhs,state,1,dt,stats)
+        if level % stride == 0 or level == final_level:
+            checkpoints[level] = state
+
+    return state, stride_pairs(step,rhs,checkpoints,stride,final_level,dt,stats)
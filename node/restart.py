@@ -0,0 +1,140 @@
+import os
+import threading
+import numpy as np
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Restart files - optimizer, sampler and RNG state written atomically (optionally from a background thread)
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# One file per MPI rank - every rank has its own parameters (between syncs), RMSProp history and RNG stream
+def restart_filename(filename,rank=None):
+    if rank is None:
+        return filename
+    root, ext = os.path.splitext(filename)
+    return root + '_rank' + str(rank) + ext
+
+def previous_filename(filename):
+    root, ext = os.path.splitext(filename)
+    return root + '_prev' + ext
+
+# Global numpy RNG (np.random.choice draws the minibatch windows) as plain arrays for np.savez
+def rng_state():
+    _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return {'rng_keys':keys,'rng_pos':pos,'rng_has_gauss':has_gauss,'rng_cached_gaussian':cached_gaussian}
+
+def set_rng_state(state):
+    np.random.set_state(('MT19937',state['rng_keys'],int(state['rng_pos']),int(state['rng_has_gauss']),float(state['rng_cached_gaussian'])))
+
+# Write to a temporary file then rename - a killed job leaves either the old or the new file, never a partial one
+def write_array(filename,array):
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename,'wb') as f:
+        np.save(f,array)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename,filename)
+
+# The previous restart file is kept, so that MPI ranks can fall back to a common iteration (see resume_state)
+def write_state(filename,state):
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename,'wb') as f:
+        np.savez(f,**state)
+        f.flush()
+        os.fsync(f.fileno())
+    if os.path.exists(filename):
+        os.replace(filename,previous_filename(filename))
+    os.replace(tmp_filename,filename)
+
+def read_state(filename):
+    with np.load(filename) as data:
+        return {key:data[key] for key in data.files}
+
+# Latest restart state, or None for a fresh start
+# comm (optional) - every rank resumes from the same iteration: the newest one all ranks have (a rank may have been
+# killed between its own write and the others')
+def resume_state(filename,comm=None):
+    states = []
+    for candidate in [filename,previous_filename(filename)]:
+        if os.path.exists(candidate):
+            try:
+                states.append(read_state(candidate))
+            except (OSError,ValueError):
+                pass # Unreadable file - fall back to the other one
+
+    if comm is None:
+        return max(states,key=lambda state: int(state['epoch'])) if len(states) > 0 else None
+
+    epochs = [int(state['epoch']) for state in states]
+    epoch = min(comm.allgather(max(epochs) if len(epochs) > 0 else -1))
+    if epoch < 0:
+        return None
+    for state in states:
+        if int(state['epoch']) == epoch:
+            if int(state['nprocs']) != comm.Get_size():
+                raise ValueError('Restart file written by '+str(int(state['nprocs']))+' ranks, running on '+str(comm.Get_size()))
+            return state
+    raise ValueError('No restart file for iteration '+str(epoch)+' on rank '+str(comm.Get_rank()))
+
+# Writes restart files every interval iterations and the best weights on improvement
+# asynchronous=True - the arrays are copied and handed to a background thread; if the thread falls behind only the
+# newest pending state per file is written
+class RestartWriter:
+    def __init__(self,interval,asynchronous=True,last_epoch=-1):
+        self.interval = interval
+        self.asynchronous = asynchronous
+        self.last_epoch = last_epoch
+        self.pending = {}
+        self.error = None
+        self.closed = False
+        self.condition = threading.Condition()
+        if asynchronous:
+            self.worker = threading.Thread(target=self.write_pending,daemon=True)
+            self.worker.start()
+
+    def due(self,epoch):
+        return self.interval > 0 and epoch - self.last_epoch >= self.interval
+
+    def write_pending(self):
+        while True:
+            with self.condition:
+                while len(self.pending) == 0 and not self.closed:
+                    self.condition.wait()
+                if len(self.pending) == 0:
+                    return
+                filename, (write, payload) = self.pending.popitem()
+            try:
+                write(filename,payload)
+            except Exception as error:
+                self.error = error
+
+    def submit(self,filename,write,payload):
+        if self.error is not None:
+            raise self.error
+        if not self.asynchronous:
+            write(filename,payload)
+            return
+        with self.condition:
+            self.pending[filename] = (write,payload)
+            self.condition.notify()
+
+    def save(self,filename,epoch,**state):
+        state = {key:np.array(value) for key, value in state.items()} # copies - training carries on updating its arrays
+        state['epoch'] = np.array(epoch)
+        state.update(rng_state())
+        self.last_epoch = epoch
+        self.submit(filename,write_state,state)
+
+    def save_weights(self,filename,thetas):
+        self.submit(filename,write_array,np.array(thetas))
+
+    # Flushes everything pending - call before reading the files back
+    def close(self):
+        if self.asynchronous:
+            with self.condition:
+                self.closed = True
+                self.condition.notify()
+            self.worker.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,51 @@
+import os
+import numpy as np
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Training data shared between ranks - time-major memory maps and disjoint window start ranges
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Coefficient files are stored (state_len,tsteps) - the time-major copy sits next to them
+def time_major_filename(filename):
+    root, ext = os.path.splitext(filename)
+    return root + '_time_major' + ext
+
+# Writes the transpose of a (state_len,tsteps) .npy file as a C-contiguous (tsteps,state_len) .npy file
+# Copied block by block through memory maps so the full array is never held in memory
+def write_time_major(filename,out_filename,block=4096):
+    source = np.load(filename,mmap_mode='r')
+    tmp_filename = out_filename + '.tmp'
+    out = np.lib.format.open_memmap(tmp_filename,mode='w+',dtype=source.dtype,shape=(source.shape[1],source.shape[0]))
+    for start in range(0,source.shape[1],block):
+        end = min(start+block,source.shape[1])
+        out[start:end,:] = source[:,start:end].T
+    out.flush()
+    del out
+    os.replace(tmp_filename,out_filename)
+
+# Read-only time-major memory map of a coefficient file - every rank on a node shares the same page cache
+# comm (optional) - rank 0 (re)writes the time-major copy if it is missing or older than the source, others wait
+def load_time_major(filename,comm=None):
+    out_filename = time_major_filename(filename)
+    rank = 0 if comm is None else comm.Get_rank()
+    if rank == 0:
+        if not os.path.exists(out_filename) or os.path.getmtime(out_filename) < os.path.getmtime(filename):
+            write_time_major(filename,out_filename)
+    if comm is not None:
+        comm.Barrier()
+    return np.load(out_filename,mmap_mode='r')
+
+# Contiguous, disjoint range [start,end) of the num_starts window start indices owned by rank
+def shard_range(num_starts,rank,nprocs):
+    if num_starts < nprocs:
+        raise ValueError('Only '+str(num_starts)+' window start indices for '+str(nprocs)+' ranks')
+    start = (num_starts*rank)//nprocs
+    end = (num_starts*(rank+1))//nprocs
+    return start, end
+
+# Random window start indices from a rank's shard
+def sample_windows(shard,num_batches):
+    start, end = shard
+    return start + np.random.choice(end-start,num_batches)
@@ -0,0 +1,129 @@
+import queue
+import threading
+import numpy as np
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Streaming training windows - trajectories larger than memory, read window by window with prefetching
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# A TrajectorySource is a list of time-major (tsteps,state_len) .npy files - one trajectory per file (e.g. per parameter
+# value), or one long trajectory stored in chunks (windows do not cross chunk boundaries). Coefficient files stored
+# (state_len,tsteps) are converted once with node.shards.write_time_major.
+# Only the .npy headers are read up front, a window of batch_tsteps snapshots is one contiguous read (readinto releases
+# the GIL, so the prefetch thread reads while the training thread computes)
+# WindowPrefetcher draws the window indices from its own RandomState and keeps depth batches read ahead - next() returns
+# (window_data,batch_ids) laid out for neural_ode_batched: the windows stacked along time, batch_ids their first rows
+
+class TrajectorySource:
+    def __init__(self,filenames,batch_tsteps):
+        self.filenames = list(filenames)
+        self.batch_tsteps = batch_tsteps
+        self.offsets = [] # byte offset of the data in each file
+        self.lengths = [] # snapshots per file
+        self.state_len = None
+        self.dtype = None
+        for filename in self.filenames:
+            data = np.load(filename,mmap_mode='r') # header only - the map is dropped right away
+            shape, dtype, offset = data.shape, data.dtype, data.offset
+            if data.ndim != 2 or not data.flags.c_contiguous:
+                raise ValueError(filename+' is not a C-ordered (tsteps,state_len) array - see node.shards.write_time_major')
+            if self.state_len is None:
+                self.state_len, self.dtype = shape[1], dtype
+            elif shape[1] != self.state_len or dtype != self.dtype:
+                raise ValueError(filename+' has '+str(shape[1])+' '+str(dtype)+' states, expected '+str(self.state_len)+' '+str(self.dtype))
+            self.offsets.append(offset)
+            self.lengths.append(shape[0])
+            del data
+
+        # Window starts per file - as np.random.choice(tsteps-batch_tsteps) in the scripts
+        self.num_starts = np.maximum(np.array(self.lengths,dtype='int64')-batch_tsteps,0)
+        self.cum_starts = np.concatenate(([0],np.cumsum(self.num_starts)))
+        self.num_windows = int(self.cum_starts[-1])
+        self.row_bytes = self.state_len*np.dtype(self.dtype).itemsize
+        self.files = None
+
+    # Global window index -> (file, first snapshot)
+    def locate(self,window_ids):
+        file_ids = np.searchsorted(self.cum_starts,window_ids,side='right') - 1
+        return file_ids, window_ids - self.cum_starts[file_ids]
+
+    # Reads the windows into out (num_windows,batch_tsteps,state_len) - in file order for locality
+    def read_windows(self,window_ids,out):
+        if self.files is None:
+            self.files = [open(filename,'rb',buffering=0) for filename in self.filenames]
+        file_ids, starts = self.locate(np.asarray(window_ids))
+        for j in np.lexsort((starts,file_ids)):
+            f = self.files[file_ids[j]]
+            f.seek(self.offsets[file_ids[j]]+int(starts[j])*self.row_bytes)
+            view = memoryview(out[j]).cast('B')
+            if f.readinto(view) != len(view):
+                raise IOError('Short read from '+self.filenames[file_ids[j]])
+        return out
+
+    def close(self):
+        if self.files is not None:
+            for f in self.files:
+                f.close()
+            self.files = None
+
+# shard - (start,end) range of global window indices sampled by this rank (node.shards.shard_range over num_windows)
+# start_batch - batches already consumed (restart), their indices are drawn again but not read
+class WindowPrefetcher:
+    def __init__(self,source,num_batches,shard=None,depth=2,seed=10,start_batch=0):
+        self.source = source
+        self.num_batches = num_batches
+        self.shard = (0,source.num_windows) if shard is None else shard
+        if self.shard[1] <= self.shard[0]:
+            raise ValueError('No windows of '+str(source.batch_tsteps)+' snapshots in the streamed trajectories')
+        self.rng = np.random.RandomState(seed)
+        for _ in range(start_batch):
+            self.draw()
+        self.num_consumed = start_batch
+        self.batch_ids = np.arange(num_batches)*source.batch_tsteps
+
+        # depth buffers in the ready queue, one being read and one held by the caller
+        self.free = queue.Queue()
+        for _ in range(depth+2):
+            self.free.put(np.empty((num_batches,source.batch_tsteps,source.state_len),dtype=source.dtype))
+        self.ready = queue.Queue(maxsize=depth)
+        self.held = None
+        self.stopped = False
+        self.worker = threading.Thread(target=self.fill,daemon=True)
+        self.worker.start()
+
+    def draw(self):
+        start, end = self.shard
+        return start + self.rng.choice(end-start,self.num_batches)
+
+    def fill(self):
+        try:
+            while not self.stopped:
+                window_ids = self.draw()
+                buffer = self.free.get()
+                if buffer is None:
+                    return
+                self.ready.put(self.source.read_windows(window_ids,buffer))
+        except Exception as error:
+            self.ready.put(error)
+
+    # Next batch - the buffer returned by the previous call is reused from here on
+    def next(self):
+        if self.held is not None:
+            self.free.put(self.held)
+        windows = self.ready.get()
+        if isinstance(windows,Exception):
+            raise windows
+        self.held = windows
+        self.num_consumed = self.num_consumed + 1
+        return np.reshape(windows,(-1,self.source.state_len)), self.batch_ids
+
+    def close(self):
+        self.stopped = True
+        self.free.put(None)
+        while self.worker.is_alive():
+            try:
+                self.ready.get(timeout=0.1) # unblock a worker waiting on a full queue
+            except queue.Empty:
+                pass
+        self.source.close()
@@ -0,0 +1,80 @@
+import json
+import itertools
+import numpy as np
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Ensembles and hyperparameter sweeps - rank groups of one MPI launch training independent configurations
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# COMM_WORLD is split into groups of group_size ranks (split_groups), each group trains one configuration at a time
+# with its own communicator (NODE_MPI.train - the training of NODE_MPI.py, gradient averaging inside the group). Configurations are handed out by a shared counter
+# on world rank 0 (WorkQueue, MPI one-sided fetch-and-add) - a group takes the next one as soon as it is idle, there
+# is no scheduler rank and no messages between groups. Results are gathered on world rank 0 at the end.
+# mpi4py communicators only (node.pool has no Split or one-sided windows)
+
+# The cartesian product of grid (parameter -> list of values) over defaults, in grid order
+def configurations(grid,defaults=None):
+    names = list(grid)
+    points = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        config = dict(defaults or {})
+        config.update(zip(names,values))
+        points.append(config)
+    return points
+
+# Sub-communicator of the group of rank - consecutive world ranks, the last group may be smaller
+def split_groups(comm,group_size):
+    if group_size < 1 or group_size > comm.Get_size():
+        raise ValueError('group_size '+str(group_size)+' for '+str(comm.Get_size())+' ranks')
+    rank = comm.Get_rank()
+    return comm.Split(rank//group_size,rank)
+
+# Dynamic work queue over num_items - collective over comm to create and free, next() is collective over group
+class WorkQueue:
+    def __init__(self,comm,group,num_items):
+        from mpi4py import MPI
+        self.MPI = MPI
+        self.comm = comm
+        self.group = group
+        self.num_items = num_items
+        self.window = MPI.Win.Allocate(8 if comm.Get_rank() == 0 else 0,8,comm=comm)
+        if comm.Get_rank() == 0:
+            self.window.Lock(0)
+            self.window.Put(np.zeros(1,dtype='int64'),0)
+            self.window.Unlock(0)
+        comm.Barrier()
+        self.one = np.ones(1,dtype='int64')
+        self.item = np.zeros(1,dtype='int64')
+
+    # Next item index for the group, None when the queue is exhausted
+    def next(self):
+        if self.group.Get_rank() == 0:
+            self.window.Lock(0,self.MPI.LOCK_SHARED)
+            self.window.Fetch_and_op(self.one,self.item,0,0,self.MPI.SUM)
+            self.window.Unlock(0)
+        self.group.Bcast(self.item,root=0)
+        item = int(self.item[0])
+        return item if item < self.num_items else None
+
+    def close(self):
+        self.comm.Barrier()
+        self.window.Free()
+
+# results - this rank's list of (index,summary dict,thetas), empty on all but the group leaders
+# Returns every result sorted by index on root, None elsewhere
+def gather_results(comm,results,root=0):
+    gathered = comm.gather(results,root=root)
+    if comm.Get_rank() != root:
+        return None
+    return sorted([result for results in gathered for result in results],key=lambda result: result[0])
+
+# summary_file - JSON list of the summaries (configuration, losses, timing) ranked by key, weights_file - .npz with
+# the thetas of configuration i under 'config_i'
+def write_summary(results,summary_file,weights_file,key='best_loss'):
+    summaries = [dict(summary,index=index) for index, summary, _ in results]
+    summaries.sort(key=lambda summary: summary[key] if summary[key] is not None else np.inf)
+    with open(summary_file,'w') as f:
+        json.dump(summaries,f,indent=1)
+    np.savez(weights_file,**{'config_'+str(index): thetas for index, _, thetas in results})
+    return summaries